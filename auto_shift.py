@@ -0,0 +1,90 @@
+from constants import Constants
+
+
+class AutoShift:
+    """
+    Delayed auto shift for the left and right keys.  Pressing a direction
+    moves the piece once straight away; while the key stays held the piece
+    repeats the move after das ticks and then every arr ticks.  advance()
+    returns every repeat that falls inside a step at once, so the shift
+    speed does not depend on how often the game is stepped, and with an arr
+    of 0 it asks for a slide to the wall as soon as das has elapsed.  The
+    most recently pressed direction wins, and releasing it stops shifting.
+    The delay keeps charging between pieces, so a held direction carries
+    over to the next piece.
+
+    soft_drop_factor is how many times faster than gravity soft drop falls.
+    """
+
+    LEFT = -1
+    RIGHT = 1
+    # shift distance that always reaches the wall
+    WALL = float("inf")
+
+    def __init__(
+        self,
+        das=Constants.DAS_MS,
+        arr=Constants.ARR_MS,
+        soft_drop_factor=Constants.SOFT_DROP_FACTOR,
+    ):
+        self.das = das
+        self.arr = arr
+        self.soft_drop_factor = soft_drop_factor
+        self.reset()
+
+    def reset(self):
+        # held direction, ticks it has been held and repeats returned so far
+        self.direction = 0
+        self.charge = 0
+        self.repeats = 0
+
+    def press(self, direction):
+        self.direction = direction
+        self.charge = 0
+        self.repeats = 0
+
+    def release(self, direction):
+        if self.direction == direction:
+            self.reset()
+
+    def advance(self, dt):
+        """
+        Moves time on by dt ticks and returns the number of columns to
+        shift for the repeats that fell within them, negative to the left.
+        advance(0) straight after a press returns the repeats due at once,
+        which there only are with a das of 0.
+        """
+        if not self.direction:
+            return 0
+        self.charge += dt
+        if self.charge < self.das:
+            return 0
+        if self.arr == 0:
+            return self.direction * AutoShift.WALL
+        repeats = (self.charge - self.das) // self.arr + 1
+        shift = repeats - self.repeats
+        self.repeats = repeats
+        return self.direction * shift
+
+    def soft_drop_speed(self, fall_speed):
+        return max(fall_speed // self.soft_drop_factor, 1)
+
+    def snapshot(self):
+        return (
+            self.das,
+            self.arr,
+            self.soft_drop_factor,
+            self.direction,
+            self.charge,
+            self.repeats,
+        )
+
+    def restore(self, snapshot):
+        (
+            self.das,
+            self.arr,
+            self.soft_drop_factor,
+            self.direction,
+            self.charge,
+            self.repeats,
+        ) = snapshot
@@ -0,0 +1,273 @@
+from constants import Constants
+from piece import Piece
+from piece_generator import PieceGenerator
+from piece_type import Orientation
+
+
+import numpy as np
+
+ORIENTATIONS = list(Orientation)
+
+
+class BatchSimulator:
+    """
+    Runs many independent games at once.  Every board is a row of a 2D
+    uint16 array holding one bitmask per board row (column x is bit x - 1,
+    array index 0 is the bottom row), and collision tests, gravity,
+    placements and line clears are applied to the whole batch with array
+    operations.  Pieces come from PieceGenerator.PIECES and are dealt from
+    a separate 7-bag per board.
+    """
+
+    # rows kept above the visible board for spawning and kicks
+    BUFFER_ROWS = 8
+    # columns that fit in a uint16 row
+    MAX_WIDTH = 16
+    LINE_SCORES = np.array([0, 100, 300, 500, 800])
+
+    # compiled tables indexed by [piece, orientation], where piece is the
+    # index in PieceGenerator.PIECES and orientation is Orientation.value - 1
+    MASKS = np.array(
+        [
+            [
+                [
+                    dict(piece_type.shapes[o].row_masks).get(
+                        piece_type.shapes[o].bottom + k, 0
+                    )
+                    for k in range(4)
+                ]
+                for o in ORIENTATIONS
+            ]
+            for piece_type in PieceGenerator.PIECES
+        ],
+        dtype=np.uint16,
+    )
+    LEFT = np.array(
+        [[t.shapes[o].left for o in ORIENTATIONS] for t in PieceGenerator.PIECES]
+    )
+    RIGHT = np.array(
+        [[t.shapes[o].right for o in ORIENTATIONS] for t in PieceGenerator.PIECES]
+    )
+    BOTTOM = np.array(
+        [[t.shapes[o].bottom for o in ORIENTATIONS] for t in PieceGenerator.PIECES]
+    )
+    # kicks padded to a common length by repeating the last kick, [p, o, k, xy]
+    KICKS = np.array(
+        [
+            [(t.cw_kicks[o][1] + (t.cw_kicks[o][1][-1],) * 5)[:5] for o in ORIENTATIONS]
+            for t in PieceGenerator.PIECES
+        ]
+    )
+
+    def __init__(
+        self,
+        size,
+        seed=None,
+        width=Constants.BOARD_WIDTH,
+        height=Constants.BOARD_HEIGHT,
+    ):
+        if width > BatchSimulator.MAX_WIDTH:
+            raise ValueError(
+                f"Board width {width} does not fit in rows of"
+                f" {BatchSimulator.MAX_WIDTH} bits"
+            )
+        self.size = size
+        self.width = width
+        self.height = height
+        self.full_row = (1 << width) - 1
+        self.rng = np.random.default_rng(seed)
+        self.reset()
+
+    def reset(self):
+        n = self.size
+        self.boards = np.zeros((n, self.height + self.BUFFER_ROWS), dtype=np.uint16)
+        self.bags = np.zeros((n, len(PieceGenerator.PIECES)), dtype=np.int8)
+        self.bag_counts = np.zeros(n, dtype=np.int8)
+        self.piece = np.zeros(n, dtype=np.int8)
+        self.orientation = np.zeros(n, dtype=np.int8)
+        self.x = np.zeros(n, dtype=np.int16)
+        self.y = np.zeros(n, dtype=np.int16)
+        self.game_over = np.zeros(n, dtype=bool)
+        self.level = np.ones(n, dtype=np.int16)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.lines = np.zeros(n, dtype=np.int64)
+        self.pieces = np.zeros(n, dtype=np.int64)
+        self.__refill(np.ones(n, dtype=bool))
+        self.spawn(np.ones(n, dtype=bool))
+
+    @property
+    def active(self):
+        return ~self.game_over
+
+    def peek(self):
+        """
+        Returns the index of the next piece in each board's bag
+        """
+        return self.bags[np.arange(self.size), self.bag_counts - 1]
+
+    def collides(self, x, y, orientation):
+        """
+        Returns for every board whether the current piece at the given
+        position and orientation overlaps a wall, the floor or a locked block
+        """
+        rows, masks, out = self.__cells(x, y, orientation)
+        n = np.arange(self.size)[:, None]
+        in_range = (rows >= 0) & (rows < self.boards.shape[1])
+        board_rows = self.boards[n, np.clip(rows, 0, self.boards.shape[1] - 1)]
+        hit = ((board_rows & masks) != 0) & in_range
+        return out | hit.any(axis=1)
+
+    def move(self, dx, where=None):
+        """
+        Shifts pieces horizontally by one cell in the direction of dx (an int
+        or per-board array) where the move is unobstructed.  Returns the
+        boards that moved.
+        """
+        dx = np.sign(np.broadcast_to(dx, (self.size,))).astype(np.int16)
+        moved = self.__mask(where) & (dx != 0)
+        moved &= ~self.collides(self.x + dx, self.y, self.orientation)
+        self.x[moved] += dx[moved]
+        return moved
+
+    def rotate_cw(self, where=None):
+        """
+        Rotates pieces clockwise, trying each kick offset in order.  Returns
+        the boards that rotated.
+        """
+        pending = self.__mask(where)
+        rotated = np.zeros(self.size, dtype=bool)
+        new_orientation = (self.orientation + 1) % 4
+        kicks = self.KICKS[self.piece, self.orientation]
+        for k in range(kicks.shape[1]):
+            x = self.x + kicks[:, k, 0]
+            y = self.y + kicks[:, k, 1]
+            ok = pending & ~self.collides(x, y, new_orientation)
+            self.x[ok] = x[ok]
+            self.y[ok] = y[ok]
+            self.orientation[ok] = new_orientation[ok]
+            rotated |= ok
+            pending &= ~ok
+        return rotated
+
+    def gravity(self, where=None):
+        """
+        Drops pieces by one row.  Returns the boards whose piece could not
+        fall because it has landed.
+        """
+        where = self.__mask(where)
+        landed = self.collides(self.x, self.y - 1, self.orientation)
+        falling = where & ~landed
+        self.y[falling] -= 1
+        return where & landed
+
+    def hard_drop(self, where=None):
+        """
+        Drops pieces until every one of them has landed
+        """
+        falling = self.__mask(where)
+        while falling.any():
+            falling &= ~self.gravity(falling)
+
+    def place(self, rotations, dx):
+        """
+        Places the current piece of every active board: rotates it clockwise
+        the given number of times, shifts it dx columns, hard drops, locks,
+        clears lines and spawns the next piece.  Returns the number of lines
+        cleared on each board.
+        """
+        rotations = np.broadcast_to(rotations, (self.size,))
+        dx = np.broadcast_to(dx, (self.size,))
+        active = self.active
+        for r in range(int(rotations.max(initial=0))):
+            self.rotate_cw(active & (rotations > r))
+        for s in range(int(np.abs(dx).max(initial=0))):
+            self.move(dx, active & (np.abs(dx) > s))
+        self.hard_drop(active)
+        self.lock(active)
+        cleared = self.clear_lines(active)
+        self.spawn(active)
+        return cleared
+
+    def lock(self, where=None):
+        """
+        Writes the current pieces into their boards
+        """
+        where = self.__mask(where)
+        rows, masks, _ = self.__cells(self.x, self.y, self.orientation)
+        height = self.boards.shape[1]
+        for k in range(rows.shape[1]):
+            r = rows[:, k]
+            sel = where & (r >= 0) & (r < height) & (masks[:, k] != 0)
+            self.boards[sel, r[sel]] |= masks[sel, k]
+        self.pieces[where] += 1
+
+    def clear_lines(self, where=None):
+        """
+        Removes full rows with a single stable compaction of every board and
+        updates lines, score and level.  Returns the number of rows cleared
+        on each board.
+        """
+        where = self.__mask(where)
+        full = (self.boards == self.full_row) & where[:, None]
+        cleared = full.sum(axis=1)
+        if cleared.any():
+            order = np.argsort(full, axis=1, kind="stable")
+            self.boards = np.take_along_axis(self.boards, order, axis=1)
+            top = self.boards.shape[1] - cleared
+            self.boards[np.arange(self.boards.shape[1]) >= top[:, None]] = 0
+
+        self.lines += cleared
+        self.score += self.LINE_SCORES[np.minimum(cleared, 4)]
+        level_up = (
+            where & (self.level < Constants.MAX_LEVEL) & (self.lines >= self.level * 10)
+        )
+        self.level[level_up] += 1
+        return cleared
+
+    def spawn(self, where=None):
+        """
+        Deals the next piece from each bag at the spawn position and checks
+        for top out, mirroring Phase.GENERATION
+        """
+        where = self.__mask(where)
+        n = np.flatnonzero(where)
+        self.bag_counts[n] -= 1
+        self.piece[n] = self.bags[n, self.bag_counts[n]]
+        self.__refill(where & (self.bag_counts == 0))
+
+        self.orientation[n] = 0
+        self.x[n], self.y[n] = Piece.spawn_position(self)
+        blocked = self.collides(self.x, self.y, self.orientation)
+        landed = self.collides(self.x, self.y - 1, self.orientation)
+        self.game_over |= where & (blocked | landed)
+        self.y[where & ~self.game_over] -= 1
+
+    def __refill(self, where):
+        n = np.flatnonzero(where)
+        if len(n):
+            bags = np.tile(np.arange(len(PieceGenerator.PIECES)), (len(n), 1))
+            self.bags[n] = self.rng.permuted(bags, axis=1)
+            self.bag_counts[n] = len(PieceGenerator.PIECES)
+
+    def __cells(self, x, y, orientation):
+        """
+        Returns the board row indices and shifted row masks covered by the
+        current pieces, along with whether they fall outside the walls or
+        floor
+        """
+        piece = self.piece
+        left = x + self.LEFT[piece, orientation]
+        bottom = y + self.BOTTOM[piece, orientation]
+        out = (
+            (left < 1)
+            | (x + self.RIGHT[piece, orientation] > self.width)
+            | (bottom < 1)
+        )
+        shift = np.clip(left - 1, 0, self.width - 1).astype(np.uint16)
+        masks = self.MASKS[piece, orientation] << shift[:, None]
+        rows = (bottom - 1)[:, None] + np.arange(self.MASKS.shape[2])
+        return rows, masks, out
+
+    def __mask(self, where):
+        active = self.active
+        return active if where is None else active & where
@@ -0,0 +1,234 @@
+import pygame
+from block import Block
+from game_core import GameCore, Phase
+from main import Game
+from piece import Piece
+from piece_generator import PieceGenerator
+from piece_type import Orientation
+
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import timeit
+
+
+class Benchmark:
+    """
+    Times the engine and renderer hot paths on scripted boards.  Each
+    fixture is a game with a T piece falling over a board filled to the
+    given height, every row with one or two gaps so that no row is full.
+    Every case is run repeat times for as many iterations as take at least
+    0.2 seconds, and the fastest run is reported in nanoseconds per
+    iteration, which is the least noisy measure of the code itself.
+    """
+
+    SEED = 0
+    # fixture name -> filled rows
+    FIXTURES = {"empty": 0, "half": 10, "topped": 17}
+    CASES = [
+        "block.can_fall",
+        "piece.is_blocked",
+        "piece.rotate_cw",
+        "piece.hard_drop",
+        "board.clear_lines",
+        "core.ghost",
+        "render.frame",
+    ]
+
+    def __init__(self, repeat=5, cases=None):
+        self.repeat = repeat
+        self.cases = cases if cases is not None else Benchmark.CASES
+        # render on the dummy video driver unless a real one was asked for
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        pygame.init()
+        self.game = Game(Benchmark.SEED)
+
+    @staticmethod
+    def fixture(rows):
+        """
+        Returns a GameCore with a falling T piece over a board whose bottom
+        rows are filled apart from their gaps
+        """
+        core = GameCore(Benchmark.SEED)
+        while core.phase != Phase.FALLING:
+            core.step()
+        core.piece = Piece(PieceGenerator.PIECES[1])
+        core.piece.fall(core.board)
+        core.blocks = [
+            Block(x, y, PieceGenerator.PIECES[(x + y) % 7].color(), Block.Style.FILL)
+            for y in range(1, rows + 1)
+            for x in range(1, core.board.width + 1)
+            if x not in Benchmark.gaps(y, core.board.width)
+        ]
+        core.board.lock((block.x, block.y) for block in core.blocks)
+        core.update_ghost()
+        return core
+
+    @staticmethod
+    def gaps(y, width):
+        gaps = {y * 3 % width + 1}
+        if y % 3 == 0:
+            gaps.add((y * 7 + 4) % width + 1)
+        return gaps
+
+    def functions(self, core):
+        """
+        Returns the function timed for each case on the fixture core
+        """
+        board = core.board
+        piece = core.piece
+        blocks = piece.blocks
+        piece_type = piece.type
+
+        # a piece resting on the stack against the left wall, where
+        # rotations need kicks
+        resting = Piece(piece_type, 2)
+        resting.move_to(
+            2, board.drop_y(resting.shape, 2, resting.y), resting.orientation
+        )
+        resting_position = (resting.x, resting.y, resting.orientation)
+
+        def rotate_cw():
+            for _ in range(4):
+                resting.rotate_cw(board)
+            resting.move_to(*resting_position)
+
+        dropping = Piece(piece_type)
+
+        def hard_drop():
+            dropping.drop(board)
+            dropping.move_to(Piece.START_X, Piece.START_Y, Orientation.NORTH)
+
+        # fills every gap, so each filled row is cleared
+        gaps = [
+            (x, y)
+            for y in range(1, max(board.heights) + 2)
+            for x in Benchmark.gaps(y, board.width)
+        ] + [(x, 1) for x in range(1, board.width + 1)]
+
+        def clear_lines():
+            cleared = board.copy()
+            cleared.lock(gaps)
+            cleared.eliminate(cleared.full_rows())
+
+        def ghost():
+            core.ghost_key = None
+            core.update_ghost()
+
+        game = self.game
+
+        def render_frame():
+            game.drawn_state = None
+            pygame.display.update(game.draw_all())
+
+        return {
+            "block.can_fall": lambda: [block.can_fall(board) for block in blocks],
+            "piece.is_blocked": lambda: piece.is_blocked(board),
+            "piece.rotate_cw": rotate_cw,
+            "piece.hard_drop": hard_drop,
+            "board.clear_lines": clear_lines,
+            "core.ghost": ghost,
+            "render.frame": render_frame,
+        }
+
+    def run(self):
+        """
+        Returns {"fixture/case": {"ns", "median_ns", "iterations"}}
+        """
+        results = {}
+        for fixture, rows in Benchmark.FIXTURES.items():
+            core = Benchmark.fixture(rows)
+            self.game.core = core
+            functions = self.functions(core)
+            for case in self.cases:
+                timer = timeit.Timer(functions[case])
+                number, _ = timer.autorange()
+                times = [t / number * 1e9 for t in timer.repeat(self.repeat, number)]
+                results[f"{fixture}/{case}"] = {
+                    "ns": min(times),
+                    "median_ns": statistics.median(times),
+                    "iterations": number,
+                }
+        return results
+
+    @staticmethod
+    def compare(results, baseline, threshold):
+        """
+        Returns (name, baseline ns, ns) for every result more than threshold
+        (a fraction) slower than in baseline
+        """
+        regressions = []
+        for name, result in results.items():
+            if name in baseline and result["ns"] > baseline[name]["ns"] * (
+                1 + threshold
+            ):
+                regressions.append((name, baseline[name]["ns"], result["ns"]))
+        return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time engine and renderer hot paths and compare to a baseline"
+    )
+    parser.add_argument("--output", default="benchmark.json", metavar="FILE")
+    parser.add_argument(
+        "--baseline",
+        metavar="FILE",
+        help="results to compare against; the run fails on regressions",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="write the results to the baseline file instead of comparing",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="fraction slower than the baseline that counts as a regression",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--case", nargs="+", choices=Benchmark.CASES, help="cases to run"
+    )
+    args = parser.parse_args()
+    if args.save_baseline and not args.baseline:
+        parser.error("--save-baseline needs --baseline FILE to write to")
+
+    results = Benchmark(args.repeat, args.case).run()
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pygame": pygame.version.ver,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = {}
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+    elif args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    for name, result in results.items():
+        line = f"{name:<28}{result['ns'] / 1000:>10.2f} us"
+        if name in baseline:
+            change = result["ns"] / baseline[name]["ns"] - 1
+            line += f"  {change:+.1%} vs baseline"
+        print(line)
+
+    regressions = Benchmark.compare(results, baseline, args.threshold)
+    for name, before, after in regressions:
+        print(
+            f"REGRESSION {name}: {before / 1000:.2f} us -> {after / 1000:.2f} us"
+            f" ({after / before - 1:+.1%}, threshold {args.threshold:+.0%})",
+            file=sys.stderr,
+        )
+    sys.exit(1 if regressions else 0)
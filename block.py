@@ -5,61 +5,74 @@ from constants import Constants
 from enum import Enum
 
 
-class Block(pygame.sprite.Sprite):
+class Block:
+    """
+    Lightweight record of a single cell: its coordinates and the color and
+    style that select its texture.  Textures are shared between all blocks
+    with the same color and style.
+    """
+
     Style = Enum("Style", ["FILL", "GHOST"])
 
+    # (color, style) -> Surface, created on first draw
+    TEXTURES = {}
+    # (left column, top row) of the board drawn at the top left of a surface
+    VIEW = (1, Constants.BOARD_HEIGHT)
+
+    __slots__ = ("x", "y", "color", "style")
+
     def __init__(self, x, y, color, style):
-        super(Block, self).__init__()
         self.x = x
         self.y = y
-        self.surf = pygame.Surface((Constants.BLOCK_WIDTH, Constants.BLOCK_HEIGHT))
-        if style == Block.Style.FILL:
-            self.surf.fill(color)
-        else:  # ghost
-            self.surf.fill((255, 255, 255))
-            self.surf.set_alpha(128)
+        self.color = color
+        self.style = style
+
+    @staticmethod
+    def texture(color, style):
+        key = (color, style)
+        surf = Block.TEXTURES.get(key)
+        if surf is None:
+            surf = pygame.Surface((Constants.BLOCK_WIDTH, Constants.BLOCK_HEIGHT))
+            if style == Block.Style.FILL:
+                surf.fill(color)
+            else:  # ghost
+                surf.fill((255, 255, 255))
+                surf.set_alpha(128)
+            Block.TEXTURES[key] = surf
+        return surf
 
     def fall(self):
         self.y -= 1
 
-    def can_fall(self, blocks):
-        return self.y > 1 and (self.x, self.y - 1) not in [
-            (block.x, block.y) for block in blocks
-        ]
+    def can_fall(self, board):
+        return self.y > 1 and board.is_empty(self.x, self.y - 1)
 
     def move_right(self):
         self.x += 1
 
-    def can_move_right(self, blocks):
-        return self.x < 10 and (self.x + 1, self.y) not in [
-            (block.x, block.y) for block in blocks
-        ]
+    def can_move_right(self, board):
+        return self.x < board.width and board.is_empty(self.x + 1, self.y)
 
     def move_left(self):
         self.x -= 1
 
-    def can_move_left(self, blocks):
-        return self.x > 1 and (self.x - 1, self.y) not in [
-            (block.x, block.y) for block in blocks
-        ]
-
-    def not_collided(self, blocks):
-        return (
-            self.x > 0
-            and self.x <= Constants.BOARD_WIDTH
-            and self.y > 0
-            and (
-                self.x,
-                self.y,
-            )
-            not in [(block.x, block.y) for block in blocks]
-        )
+    def can_move_left(self, board):
+        return self.x > 1 and board.is_empty(self.x - 1, self.y)
+
+    def not_collided(self, board):
+        return board.fits(self.x, self.y)
 
-    def draw(self, screen):
-        screen.blit(
-            self.surf,
+    def draw(self, screen, offset_y=0, view=VIEW):
+        """
+        Draws the block offset_y pixels below its cell, on a screen showing
+        the board from view, the (left column, top row) in its top left
+        corner
+        """
+        left, top = view
+        return screen.blit(
+            Block.texture(self.color, self.style),
             (
-                (self.x - 1) * Constants.BLOCK_WIDTH,
-                (Constants.BOARD_HEIGHT - self.y) * Constants.BLOCK_HEIGHT,
+                (self.x - left) * Constants.BLOCK_WIDTH,
+                (top - self.y) * Constants.BLOCK_HEIGHT + offset_y,
             ),
         )
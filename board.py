@@ -0,0 +1,174 @@
+from constants import Constants
+from zobrist import Zobrist
+
+
+class Board:
+    """
+    Occupancy model of the playfield.  Each row is stored as an integer
+    bitmask where bit (x - 1) is set if column x is filled.  Rows use the
+    same 1-indexed coordinates as blocks (y = 1 is the bottom row), and rows
+    above the visible board are kept so pieces can lock out above the top.
+    """
+
+    def __init__(self, width=Constants.BOARD_WIDTH, height=Constants.BOARD_HEIGHT):
+        self.width = width
+        self.height = height
+        self.full_row = (1 << width) - 1
+        # index 0 is unused so that rows[y] is row y
+        self.rows = [0] * (height + 1)
+        # number of filled cells in each row, and the rows that are full
+        self.fill_counts = [0] * (height + 1)
+        self.completed = set()
+        # heights[x - 1] is the y of the highest filled cell in column x
+        self.heights = [0] * width
+        # incremented whenever the occupancy changes
+        self.version = 0
+        # Zobrist hash of the filled cells
+        self.hash = 0
+        # BoardFeatures tracker kept up to date by lock and eliminate
+        self.features = None
+
+    def copy(self):
+        board = Board.__new__(Board)
+        board.width = self.width
+        board.height = self.height
+        board.full_row = self.full_row
+        board.rows = self.rows.copy()
+        board.fill_counts = self.fill_counts.copy()
+        board.completed = self.completed.copy()
+        board.heights = self.heights.copy()
+        board.version = self.version
+        board.hash = self.hash
+        board.features = self.features.copy(board) if self.features else None
+        return board
+
+    def row(self, y):
+        return self.rows[y] if 0 < y < len(self.rows) else 0
+
+    def is_empty(self, x, y):
+        return not (self.row(y) >> (x - 1)) & 1
+
+    def fits(self, x, y):
+        """
+        Returns true if a block at (x, y) is within the walls and floor and
+        does not overlap a locked block
+        """
+        return 0 < x <= self.width and y > 0 and self.is_empty(x, y)
+
+    def can_place(self, shape, x, y):
+        """
+        Returns true if the compiled shape positioned at (x, y) is within
+        the walls and floor and does not overlap a locked block
+        """
+        left = x + shape.left
+        if left < 1 or x + shape.right > self.width or y + shape.bottom < 1:
+            return False
+        rows = self.rows
+        for dy, mask in shape.row_masks:
+            row_y = y + dy
+            if row_y < len(rows) and rows[row_y] & (mask << (left - 1)):
+                return False
+        return True
+
+    def drop_y(self, shape, x, y):
+        """
+        Returns the y the shape at (x, y) lands on if dropped straight down.
+        When the shape is above the skyline in every column this is computed
+        from the column heights, otherwise it steps down row by row.
+        """
+        heights = self.heights
+        landing = max(heights[x + dx - 1] + 1 - dy for dx, dy in shape.bottom_profile)
+        if landing <= y:
+            return landing
+        while self.can_place(shape, x, y - 1):
+            y -= 1
+        return y
+
+    def lock(self, cells):
+        """
+        Marks the given (x, y) cells as occupied
+        """
+        filled = [] if self.features else None
+        for x, y in cells:
+            if y >= len(self.rows):
+                self.rows.extend([0] * (y - len(self.rows) + 1))
+                self.fill_counts.extend([0] * (y - len(self.fill_counts) + 1))
+            bit = 1 << (x - 1)
+            if self.rows[y] & bit:
+                continue
+            self.rows[y] |= bit
+            self.hash ^= Zobrist.cell(x, y)
+            self.fill_counts[y] += 1
+            if self.fill_counts[y] == self.width:
+                self.completed.add(y)
+            if y > self.heights[x - 1]:
+                self.heights[x - 1] = y
+            if filled is not None:
+                filled.append((x, y))
+        self.version += 1
+        if filled:
+            self.features.locked(filled)
+
+    def full_rows(self):
+        return sorted(self.completed)
+
+    def eliminate(self, rows):
+        """
+        Removes the given rows in a single compaction pass, shifting
+        everything above them down
+        """
+        eliminated = set(rows)
+        if not eliminated:
+            return
+        # only rows from the lowest eliminated one upwards change
+        lowest = min(eliminated)
+        removed = [self.rows[y] for y in eliminated if y < len(self.rows)]
+        for y in range(lowest, len(self.rows)):
+            self.hash ^= Zobrist.row(y, self.rows[y])
+        write = 1
+        for y in range(1, len(self.rows)):
+            if y in eliminated:
+                continue
+            self.rows[write] = self.rows[y]
+            self.fill_counts[write] = self.fill_counts[y]
+            write += 1
+        for y in range(write, len(self.rows)):
+            self.rows[y] = 0
+            self.fill_counts[y] = 0
+        for y in range(lowest, write):
+            self.hash ^= Zobrist.row(y, self.rows[y])
+        self.completed = {
+            y for y in range(1, write) if self.fill_counts[y] == self.width
+        }
+        self.__update_heights()
+        self.version += 1
+        if self.features:
+            self.features.eliminated(lowest, removed)
+
+    def clear(self):
+        self.rows = [0] * (self.height + 1)
+        self.fill_counts = [0] * (self.height + 1)
+        self.completed = set()
+        self.heights = [0] * self.width
+        self.version += 1
+        self.hash = 0
+        if self.features:
+            self.features.rebuild()
+
+    def __update_heights(self):
+        """
+        Recomputes column heights by scanning down from the top row until
+        every column has been seen
+        """
+        heights = [0] * self.width
+        unseen = self.full_row
+        for y in range(len(self.rows) - 1, 0, -1):
+            found = self.rows[y] & unseen
+            while found:
+                bit = found & -found
+                heights[bit.bit_length() - 1] = y
+                found ^= bit
+            unseen &= ~self.rows[y]
+            if not unseen:
+                break
+        self.heights = heights
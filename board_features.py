@@ -0,0 +1,189 @@
+import numpy as np
+
+
+class BoardFeatures:
+    """
+    Board statistics used by evaluators, kept up to date as the board they
+    are attached to locks cells and eliminates rows instead of being
+    recomputed from scratch.  Locking only touches the locked cells' rows
+    and columns, and eliminating only the rows from the lowest eliminated
+    one up.  The column statistics are derived from the board's column
+    heights and the tracked cell count of each column in O(width).
+
+    row_transitions[y] is the number of filled/empty changes along row y
+    with the walls counted as filled, and column_transitions[y] the number
+    of columns that differ between rows y - 1 and y, with row 0 being the
+    filled floor.
+    """
+
+    def __init__(self, board):
+        self.board = board
+        self.rebuild()
+
+    @staticmethod
+    def attach(board):
+        """
+        Attaches a feature tracker to board, which keeps it up to date
+        """
+        board.features = BoardFeatures(board)
+        return board.features
+
+    def copy(self, board):
+        features = BoardFeatures.__new__(BoardFeatures)
+        features.board = board
+        features.column_counts = self.column_counts.copy()
+        features.row_transitions = self.row_transitions.copy()
+        features.column_transitions = self.column_transitions.copy()
+        return features
+
+    def rebuild(self):
+        board = self.board
+        self.column_counts = [0] * board.width
+        for row in board.rows[1:]:
+            for x in range(board.width):
+                self.column_counts[x] += row >> x & 1
+        self.row_transitions = [0] * len(board.rows)
+        self.column_transitions = [0] * (len(board.rows) + 1)
+        self.__update_rows(1, len(board.rows))
+
+    def locked(self, cells):
+        """
+        Called by the board with the (x, y) cells it has just filled
+        """
+        rows = self.board.rows
+        if len(self.row_transitions) < len(rows):
+            grow = len(rows) - len(self.row_transitions)
+            self.row_transitions.extend([2] * grow)
+            self.column_transitions.extend([0] * grow)
+        changed = set()
+        for x, y in cells:
+            self.column_counts[x - 1] += 1
+            changed.add(y)
+        for y in changed:
+            self.__update_rows(y, y + 1)
+
+    def eliminated(self, lowest, removed):
+        """
+        Called by the board after eliminating rows, where lowest is the
+        lowest eliminated row and removed the bitmasks the rows held
+        """
+        for row in removed:
+            for x in range(self.board.width):
+                self.column_counts[x] -= row >> x & 1
+        self.__update_rows(lowest, len(self.board.rows))
+
+    @property
+    def holes(self):
+        """
+        Number of empty cells below the top of each column
+        """
+        return [
+            height - count
+            for height, count in zip(self.board.heights, self.column_counts)
+        ]
+
+    @property
+    def hole_count(self):
+        return sum(self.board.heights) - sum(self.column_counts)
+
+    @property
+    def aggregate_height(self):
+        return sum(self.board.heights)
+
+    @property
+    def bumpiness(self):
+        heights = self.board.heights
+        return sum(abs(a - b) for a, b in zip(heights, heights[1:]))
+
+    @property
+    def wells(self):
+        """
+        How far each column is below both of its neighbours, with the walls
+        as neighbours of the board's height
+        """
+        board = self.board
+        walled = [board.height] + board.heights + [board.height]
+        return [
+            max(0, min(walled[i - 1], walled[i + 1]) - walled[i])
+            for i in range(1, len(walled) - 1)
+        ]
+
+    @property
+    def well_depth(self):
+        return sum(self.wells)
+
+    @property
+    def total_row_transitions(self):
+        """
+        Row transitions of the visible rows
+        """
+        return sum(self.row_transitions[1 : self.board.height + 1])
+
+    @property
+    def total_column_transitions(self):
+        return sum(self.column_transitions)
+
+    def __update_rows(self, start, stop):
+        """
+        Recomputes the transitions of rows start to stop - 1, and the
+        column transitions between each of them and the row below
+        """
+        board = self.board
+        rows = board.rows
+        walls = 1 | 1 << (board.width + 1)
+        span = (1 << (board.width + 1)) - 1
+        for y in range(start, stop):
+            padded = rows[y] << 1 | walls
+            self.row_transitions[y] = ((padded ^ padded >> 1) & span).bit_count()
+            below = rows[y - 1] if y > 1 else board.full_row
+            self.column_transitions[y] = (rows[y] ^ below).bit_count()
+        if stop == len(rows):
+            # the top row against the empty space above the board
+            self.column_transitions[stop] = rows[-1].bit_count()
+        else:
+            self.column_transitions[stop] = (rows[stop] ^ rows[stop - 1]).bit_count()
+
+    @staticmethod
+    def batch(boards, width, height=None):
+        """
+        Computes the features of many boards at once.  boards is an
+        (N, rows) integer array of row bitmasks with index 0 the bottom row,
+        like BatchSimulator.boards, and height the board height walls are
+        measured against, which defaults to the number of rows.  Returns a
+        dict of arrays: heights, holes and wells of shape (N, width), and
+        bumpiness, row_transitions and column_transitions of shape (N,).
+        Row transitions are counted over the first height rows.
+        """
+        boards = np.asarray(boards)
+        height = boards.shape[1] if height is None else height
+        cells = (boards[:, :, None] >> np.arange(width)) & 1
+        filled = cells.astype(bool)
+
+        rows = cells.shape[1]
+        top = rows - np.argmax(filled[:, ::-1, :], axis=1)
+        heights = np.where(filled.any(axis=1), top, 0)
+        holes = heights - cells.sum(axis=1)
+        bumpiness = np.abs(np.diff(heights, axis=1)).sum(axis=1)
+
+        walls = np.ones(cells.shape[:2] + (1,), dtype=cells.dtype)
+        padded = np.concatenate([walls, cells, walls], axis=2)
+        row_transitions = (np.diff(padded[:, :height], axis=2) != 0).sum(axis=(1, 2))
+
+        floor = np.ones((cells.shape[0], 1, width), dtype=cells.dtype)
+        space = np.zeros((cells.shape[0], 1, width), dtype=cells.dtype)
+        stacked = np.concatenate([floor, cells, space], axis=1)
+        column_transitions = (np.diff(stacked, axis=1) != 0).sum(axis=(1, 2))
+
+        side = np.full((cells.shape[0], 1), height)
+        walled = np.concatenate([side, heights, side], axis=1)
+        wells = np.maximum(
+            0, np.minimum(walled[:, :-2], walled[:, 2:]) - walled[:, 1:-1]
+        )
+        return {
+            "heights": heights,
+            "holes": holes,
+            "wells": wells,
+            "bumpiness": bumpiness,
+            "row_transitions": row_transitions,
+            "column_transitions": column_transitions,
+        }
@@ -0,0 +1,387 @@
+from board_features import BoardFeatures
+from game_core import GameCore, Action, Phase, State
+from piece import Piece
+from piece_type import Orientation
+from placement_finder import Move, PlacementFinder
+from transposition_table import TranspositionTable
+from zobrist import Zobrist
+
+
+import argparse
+import time
+
+
+class Bot:
+    """
+    Computer player that drives a GameCore through the same (Action,
+    pressed) inputs as the keyboard.  When a new piece appears it runs a
+    beam search over the placements of the current piece, the next piece
+    and the hold slot, scoring boards by cleared lines, aggregate height,
+    holes, bumpiness and well depth, then plays the chosen placement one
+    key press per step.
+    """
+
+    WEIGHTS = {
+        "lines": 0.76,
+        "height": -0.51,
+        "holes": -0.36,
+        "bumpiness": -0.18,
+        "wells": -0.1,
+    }
+    # evaluation of a board where a placement locked out above the top
+    TOP_OUT = -1e9
+    # step length used when driving a core headlessly
+    FRAME_MS = 16
+    # routes found for one piece before giving up and hard dropping it
+    MAX_ROUTES = 4
+
+    MOVE_ACTIONS = {
+        Move.LEFT: Action.LEFT,
+        Move.RIGHT: Action.RIGHT,
+        Move.ROTATE_CW: Action.ROTATE_CW,
+        Move.DROP: Action.SOFT_DROP,
+    }
+
+    def __init__(self, beam_width=8, time_budget_ms=50, weights=None, restart=True):
+        """
+        beam_width is the number of boards kept at each search depth, and
+        time_budget_ms bounds the search for each piece; when it runs out
+        the best board of the deepest completed level is used, or of the
+        placements scored so far if the first level is not complete.  If restart
+        is true the bot confirms a new game after a top out.
+        """
+        self.beam_width = beam_width
+        self.time_budget_ms = time_budget_ms
+        self.weights = dict(Bot.WEIGHTS, **(weights or {}))
+        self.restart = restart
+        self.finder = PlacementFinder()
+        self.evaluations = TranspositionTable()
+        self.pieces = 0
+
+        # the piece being played, the cells it should end up on, whether it
+        # is to be held first, and the remaining (action, state after) route
+        self.piece = None
+        self.target = None
+        self.hold = False
+        self.route = []
+        self.routes = 0
+        self.expected = None
+        self.pressed = set()
+
+    def inputs(self, core):
+        """
+        Returns the inputs to pass to the next core.step.  Keys are held
+        for one step and released on the next.
+        """
+        actions = self.__actions(core)
+        inputs = [(action, False) for action in self.pressed - actions]
+        inputs.extend((action, True) for action in actions - self.pressed)
+        self.pressed = actions
+        return inputs
+
+    def __actions(self, core):
+        """
+        Returns the set of actions that should be held during the next step
+        """
+        if core.state == State.GAME_OVER:
+            if self.restart and Action.CONFIRM not in self.pressed:
+                return {Action.CONFIRM}
+            return set()
+        if core.state != State.PLAYING or core.phase not in (
+            Phase.FALLING,
+            Phase.LOCK,
+        ):
+            return set()
+
+        piece = core.piece
+        state = (piece.x, piece.y, piece.orientation)
+        if piece is not self.piece:
+            self.piece = piece
+            self.routes = 0
+            if self.hold:
+                # the placement for the piece swapped in was chosen already
+                self.hold = False
+                self.__reroute(core)
+            else:
+                self.__plan(core)
+        elif not self.hold and state != self.expected:
+            # catch up with rows fallen under gravity, or find a new route to
+            # the same cells if the piece has been pushed off this one
+            for i, (_, after) in enumerate(self.route):
+                if after == state:
+                    del self.route[: i + 1]
+                    self.expected = state
+                    break
+            else:
+                self.__reroute(core)
+        if self.hold:
+            return set() if Action.HOLD in self.pressed else {Action.HOLD}
+
+        if not self.route:
+            return set()
+        action, after = self.route[0]
+        if action == Action.SOFT_DROP:
+            # held until gravity brings the piece down a row
+            return {Action.SOFT_DROP}
+        if action in self.pressed or Action.SOFT_DROP in self.pressed:
+            # released for a step so it can be pressed again, or so that the
+            # piece is back at normal speed before it is moved
+            return set()
+        self.route.pop(0)
+        self.expected = after
+        if action == Action.HARD_DROP:
+            self.pieces += 1
+        return {action}
+
+    def __plan(self, core):
+        piece = core.piece
+        start = (piece.x, piece.y, piece.orientation)
+        choice = self.search(
+            core.board,
+            piece.type,
+            [core.piece_generator.peek()],
+            core.held_piece,
+            not core.held_swapped,
+            start,
+        )
+        self.route = []
+        self.expected = start
+        if choice is None:
+            return
+        placement, self.hold = choice
+        self.target = set(placement.cells())
+        if not self.hold:
+            self.route = self.__compile(core.board, placement, start)
+
+    def __reroute(self, core):
+        piece = core.piece
+        start = (piece.x, piece.y, piece.orientation)
+        self.routes += 1
+        if self.routes > Bot.MAX_ROUTES:
+            self.route = [(Action.HARD_DROP, None)]
+            self.expected = start
+            return
+        deadline = time.perf_counter() + self.time_budget_ms / 1000
+        placements = self.finder.find(core.board, piece.type, *start, deadline)
+        if placements is None:
+            placements = PlacementFinder.drops(core.board, piece.type, *start)
+        for placement in placements:
+            if set(placement.cells()) == self.target:
+                self.route = self.__compile(core.board, placement, start)
+                self.expected = start
+                return
+        self.__plan(core)
+
+    def search(self, board, current, queue, held, can_hold, start):
+        """
+        Returns (placement, hold) for the current piece type, where hold is
+        true if the placement is for the piece swapped in by holding, or
+        None if no placement exists.  Boards are expanded one piece of the
+        known sequence [current] + queue at a time, keeping the beam_width
+        best at each depth.
+        """
+        deadline = time.perf_counter() + self.time_budget_ms / 1000
+        pieces = [current] + list(queue)
+        # boards in the search keep their features up to date as they are
+        # copied and placed on
+        if board.features is None:
+            board = board.copy()
+            BoardFeatures.attach(board)
+        # (score, line reward so far, board, held, index of next piece, first)
+        beam = [(0, 0, board, held, 0, None)]
+        best = None
+        depth = 0
+        while beam and time.perf_counter() < deadline:
+            children = []
+            for _, reward, node_board, node_held, index, first in beam:
+                if index >= len(pieces):
+                    continue
+                for piece_type, next_index, next_held, hold, spawn in self.__options(
+                    node_board, pieces, index, node_held, can_hold or depth > 0
+                ):
+                    if depth == 0:
+                        # the moves are only needed for the piece played now;
+                        # if finding them all takes longer than the budget,
+                        # the placements reachable by hard drops will do
+                        piece_start = spawn if hold else start
+                        placements = self.finder.find(
+                            node_board, piece_type, *piece_start, deadline
+                        )
+                        if placements is None:
+                            placements = PlacementFinder.drops(
+                                node_board, piece_type, *piece_start
+                            )
+                        moves = (
+                            (placement.cells(), placement) for placement in placements
+                        )
+                    else:
+                        moves = (
+                            (placement.cells(), None)
+                            for placement in PlacementFinder.drops(
+                                node_board, piece_type, *spawn
+                            )
+                        )
+                    for cells, placement in moves:
+                        if children and time.perf_counter() >= deadline:
+                            break
+                        child, lines = Bot.__place(node_board, cells)
+                        child_reward = reward + self.weights["lines"] * lines
+                        children.append(
+                            (
+                                child_reward + self.evaluate(child),
+                                child_reward,
+                                child,
+                                next_held,
+                                next_index,
+                                first or (placement, hold),
+                            )
+                        )
+                if time.perf_counter() >= deadline:
+                    # an incomplete first level still holds the best of the
+                    # placements scored so far, deeper ones are dropped for
+                    # the last complete level
+                    if depth > 0:
+                        children = []
+                    break
+            if not children:
+                break
+            children.sort(key=lambda child: child[0], reverse=True)
+            beam = children[: self.beam_width]
+            best = beam[0][5]
+            depth += 1
+        return best
+
+    @staticmethod
+    def __options(board, pieces, index, held, can_hold):
+        """
+        Yields (piece type, next index, held, hold, start) for each piece
+        that can be placed next: the current one, or the held or next one
+        if the current piece is held.  Pieces dealt by the generator start
+        a row below the spawn position, like after Phase.GENERATION, while
+        pieces swapped in by holding start at the spawn position.
+        """
+        x, y = Piece.spawn_position(board)
+        spawn = (x, y, Orientation.NORTH)
+        dealt = (x, y - 1, Orientation.NORTH)
+        yield pieces[index], index + 1, held, False, dealt
+        if not can_hold:
+            return
+        if held is None:
+            if index + 1 < len(pieces):
+                yield pieces[index + 1], index + 2, pieces[index], True, spawn
+        elif held is not pieces[index]:
+            yield held, index + 1, pieces[index], True, spawn
+
+    @staticmethod
+    def __place(board, cells):
+        """
+        Returns a copy of board with the cells locked and full rows cleared,
+        and the number of rows cleared
+        """
+        child = board.copy()
+        child.lock(cells)
+        lines = child.full_rows()
+        child.eliminate(lines)
+        return child, len(lines)
+
+    def evaluate(self, board):
+        """
+        Scores a board, higher is better.  Results are cached by the board's
+        Zobrist hash and size.
+        """
+        key = board.hash ^ Zobrist.size(board)
+        score = self.evaluations.get(key)
+        if score is not None:
+            return score
+
+        if max(board.heights) > board.height:
+            score = Bot.TOP_OUT
+        else:
+            features = board.features or BoardFeatures(board)
+            weights = self.weights
+            score = (
+                weights["height"] * features.aggregate_height
+                + weights["holes"] * features.hole_count
+                + weights["bumpiness"] * features.bumpiness
+                + weights["wells"] * features.well_depth
+            )
+        self.evaluations.put(key, score)
+        return score
+
+    def __compile(self, board, placement, start):
+        """
+        Turns a placement's path into a route of actions, each paired with
+        the state the piece is expected to be in after it.  Paths whose
+        drops can all be replaced by a final hard drop use only the moves
+        and a hard drop; other drops become soft drops.
+        """
+        target = (placement.x, placement.y, placement.orientation)
+        piece_type = placement.type
+        moves = [move for move in placement.path if move != Move.DROP]
+        route = self.__walk(board, piece_type, start, moves)
+        if route is not None:
+            x, y, orientation = route[-1][1] if route else start
+            y = board.drop_y(piece_type.shapes[orientation], x, y)
+            if (x, y, orientation) != target:
+                route = None
+        if route is None:
+            moves = list(placement.path)
+            while moves and moves[-1] == Move.DROP:
+                moves.pop()
+            route = self.__walk(board, piece_type, start, moves) or []
+        route.append((Action.HARD_DROP, None))
+        return route
+
+    @staticmethod
+    def __walk(board, piece_type, state, moves):
+        """
+        Returns the route for the moves from state, or None if one of them
+        is blocked
+        """
+        route = []
+        for move in moves:
+            x, y, orientation = state
+            match move:
+                case Move.LEFT:
+                    x -= 1
+                case Move.RIGHT:
+                    x += 1
+                case Move.DROP:
+                    y -= 1
+                case Move.ROTATE_CW:
+                    orientation, kicks = piece_type.cw_kicks[orientation]
+                    shape = piece_type.shapes[orientation]
+                    for dx, dy in kicks:
+                        if board.can_place(shape, x + dx, y + dy):
+                            x, y = x + dx, y + dy
+                            break
+                    else:
+                        return None
+            if not board.can_place(piece_type.shapes[orientation], x, y):
+                return None
+            state = (x, y, orientation)
+            route.append((Bot.MOVE_ACTIONS[move], state))
+        return route
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Let the bot play headlessly and report its throughput"
+    )
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--pieces", type=int, default=500)
+    parser.add_argument("--beam-width", type=int, default=8)
+    parser.add_argument("--time-budget", type=float, default=50, metavar="MS")
+    args = parser.parse_args()
+
+    core = GameCore(args.seed)
+    bot = Bot(args.beam_width, args.time_budget)
+    start = time.perf_counter()
+    while bot.pieces < args.pieces:
+        core.step(bot.inputs(core), Bot.FRAME_MS)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{bot.pieces} pieces in {elapsed:.2f}s ({bot.pieces / elapsed:.1f} pieces/s),"
+        f" {core.games - 1} top outs, current game: score {core.score}"
+        f" lines {core.lines} level {core.level}"
+    )
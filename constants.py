@@ -1,21 +1,19 @@
-import pygame
-
-
 class Constants:
     BLOCK_HEIGHT = 40
     BLOCK_WIDTH = 40
 
+    # standard board, which is also the size of the view on larger boards
     BOARD_WIDTH = 10
     BOARD_HEIGHT = 20
+    MAX_BOARD_WIDTH = 100
+    MAX_BOARD_HEIGHT = 200
     SCREEN_WIDTH = BOARD_WIDTH * BLOCK_WIDTH + 480
     SCREEN_HEIGHT = BOARD_HEIGHT * BLOCK_HEIGHT
 
     MAX_LEVEL = 15
 
-    AUTO_REPEAT_DELAY_MS = 300
+    # delayed auto shift, auto repeat rate and soft drop speed up
+    DAS_MS = 300
+    ARR_MS = 16
+    SOFT_DROP_FACTOR = 20
     LOCKDOWN_DELAY_MS = 500
-
-    FALL_EVENT = pygame.USEREVENT + 1
-    LOCKDOWN_EVENT = pygame.USEREVENT + 2
-    LEFT_AUTO_REPEAT_EVENT = pygame.USEREVENT + 3
-    RIGHT_AUTO_REPEAT_EVENT = pygame.USEREVENT + 4
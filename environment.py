@@ -0,0 +1,313 @@
+from constants import Constants
+from game_core import GameCore, Action, Phase, State
+from game_state import GameState
+
+
+from multiprocessing import Pipe, Process
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+
+
+class Environment:
+    """
+    Gym-style wrapper around a GameCore for reinforcement learning.  An
+    action is an index into ACTIONS and holds that key for one frame, the
+    reward is the score gained, and an episode ends when the game is over.
+
+    Observations are a board array, where board[y - 1, x - 1] is 1 for a
+    locked block and 2 for the active piece, and a pieces array of
+    [current, next, hold, x, y, orientation], where pieces are indices into
+    PieceGenerator.PIECES (-1 for none) and orientation is
+    Orientation.value - 1.  They are written into the arrays given to the
+    constructor, so a VectorEnvironment can place them in shared memory.
+    The board array is (height, width) for a board of any size.
+    """
+
+    ACTIONS = [
+        None,
+        Action.LEFT,
+        Action.RIGHT,
+        Action.ROTATE_CW,
+        Action.SOFT_DROP,
+        Action.HARD_DROP,
+        Action.HOLD,
+    ]
+    PIECES_SIZE = 6
+
+    def __init__(
+        self,
+        frame_ms=16,
+        board=None,
+        pieces=None,
+        width=Constants.BOARD_WIDTH,
+        height=Constants.BOARD_HEIGHT,
+    ):
+        self.frame_ms = frame_ms
+        self.board = (
+            board if board is not None else np.zeros((height, width), dtype=np.uint8)
+        )
+        self.pieces = (
+            pieces
+            if pieces is not None
+            else np.zeros(Environment.PIECES_SIZE, dtype=np.int16)
+        )
+        # bytes per row when rows are unpacked from their bitmasks
+        self.row_bytes = (self.board.shape[1] + 7) // 8
+        self.core = None
+        self.held = None
+
+    def reset(self, seed=None):
+        """
+        Starts a new game and returns the first observation.  Without a
+        seed the next game of the current core is played, so a sequence of
+        episodes is determined by the first seed.
+        """
+        if seed is not None or self.core is None:
+            height, width = self.board.shape
+            self.core = GameCore(seed, width=width, height=height)
+        else:
+            self.core.init_game()
+            self.core.state = State.PLAYING
+        self.held = None
+        self.__advance((), 0)
+        return self.observe()
+
+    def step(self, action):
+        """
+        Holds the action's key for one frame and returns (observation,
+        reward, done, info)
+        """
+        core = self.core
+        action = Environment.ACTIONS[action]
+        inputs = []
+        if not action == self.held == Action.SOFT_DROP:
+            # other keys are pressed again rather than held, which would auto
+            # repeat, while soft drop stays held as long as it is repeated
+            if self.held is not None:
+                inputs.append((self.held, False))
+            if action is not None:
+                inputs.append((action, True))
+        self.held = action
+
+        score = core.score
+        self.__advance(inputs, self.frame_ms)
+        done = core.state == State.GAME_OVER
+        info = {"lines": core.lines, "level": core.level, "score": core.score}
+        return self.observe(), core.score - score, done, info
+
+    def __advance(self, inputs, dt):
+        """
+        Steps the core, then runs the phases between pieces so that the
+        next observation has a piece in play
+        """
+        core = self.core
+        core.step(inputs, dt)
+        while core.state == State.PLAYING and core.phase not in (
+            Phase.FALLING,
+            Phase.LOCK,
+        ):
+            core.step()
+
+    def observe(self):
+        core = self.core
+        height, width = self.board.shape
+        # rows are arbitrary width ints, unpacked through their bytes
+        packed = b"".join(
+            row.to_bytes(self.row_bytes, "little")
+            for row in core.board.rows[1 : height + 1]
+        )
+        cells = np.frombuffer(packed, dtype=np.uint8).reshape(height, self.row_bytes)
+        self.board[:] = np.unpackbits(cells, axis=1, bitorder="little")[:, :width]
+
+        pieces = self.pieces
+        pieces[:] = -1
+        piece = core.piece
+        if piece is not None and piece.blocks:
+            for block in piece.blocks:
+                if 0 < block.y <= height:
+                    self.board[block.y - 1, block.x - 1] = 2
+            pieces[0] = GameState.TYPE_INDEX[piece.type.NAME]
+            pieces[3] = piece.x
+            pieces[4] = piece.y
+            pieces[5] = piece.orientation.value - 1
+        pieces[1] = GameState.TYPE_INDEX[core.piece_generator.peek().NAME]
+        if core.held_piece is not None:
+            pieces[2] = GameState.TYPE_INDEX[core.held_piece.NAME]
+        return self.board, self.pieces
+
+
+class VectorEnvironment:
+    """
+    Steps many Environments per call, either in process or split across
+    worker processes.  Observations, rewards, done flags and actions live
+    in one shared memory block that every worker writes its environments'
+    slices of, so only short commands cross the process boundary.
+    Environments that finish are reset to their next game straight away,
+    so the returned observation is already that of the new game.
+    """
+
+    def __init__(
+        self,
+        size,
+        workers=0,
+        frame_ms=16,
+        width=Constants.BOARD_WIDTH,
+        height=Constants.BOARD_HEIGHT,
+    ):
+        self.size = size
+        self.frame_ms = frame_ms
+        self.shape = (height, width)
+        self.workers = []
+        self.memory = None
+        if workers:
+            self.memory = SharedMemory(
+                create=True, size=VectorEnvironment.buffer_size(size, self.shape)
+            )
+            buffer = self.memory.buf
+        else:
+            buffer = bytearray(VectorEnvironment.buffer_size(size, self.shape))
+        (
+            self.rewards,
+            self.pieces,
+            self.actions,
+            self.dones,
+            self.boards,
+        ) = VectorEnvironment.arrays(buffer, size, self.shape)
+
+        if workers:
+            bounds = np.linspace(0, size, workers + 1, dtype=int)
+            for start, stop in zip(bounds, bounds[1:]):
+                connection, child = Pipe()
+                process = Process(
+                    target=VectorEnvironment.work,
+                    args=(
+                        self.memory.name,
+                        size,
+                        self.shape,
+                        start,
+                        stop,
+                        frame_ms,
+                        child,
+                    ),
+                    daemon=True,
+                )
+                process.start()
+                self.workers.append((connection, process, start, stop))
+        else:
+            self.environments = VectorEnvironment.environments(
+                self.boards, self.pieces, 0, size, frame_ms
+            )
+
+    @staticmethod
+    def buffer_size(size, shape):
+        height, width = shape
+        return size * (8 + 2 * Environment.PIECES_SIZE + 1 + 1 + height * width)
+
+    @staticmethod
+    def arrays(buffer, size, shape):
+        """
+        Returns the rewards, pieces, actions, dones and boards arrays laid
+        out in buffer, largest items first so every array is aligned
+        """
+        shapes = [
+            (np.float64, (size,)),
+            (np.int16, (size, Environment.PIECES_SIZE)),
+            (np.int8, (size,)),
+            (np.bool_, (size,)),
+            (np.uint8, (size, *shape)),
+        ]
+        arrays = []
+        offset = 0
+        for dtype, shape in shapes:
+            array = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+            offset += array.nbytes
+            arrays.append(array)
+        return arrays
+
+    @staticmethod
+    def environments(boards, pieces, start, stop, frame_ms):
+        return [Environment(frame_ms, boards[i], pieces[i]) for i in range(start, stop)]
+
+    def reset(self, seeds=None):
+        """
+        Starts every environment and returns (boards, pieces).  seeds is a
+        list with one seed, or None, per environment.
+        """
+        seeds = seeds if seeds is not None else [None] * self.size
+        if self.workers:
+            for connection, _, start, stop in self.workers:
+                connection.send(("reset", seeds[start:stop]))
+            for connection, *_ in self.workers:
+                connection.recv()
+        else:
+            VectorEnvironment.reset_all(self.environments, seeds)
+        return self.boards, self.pieces
+
+    def step(self, actions):
+        """
+        Steps every environment with its action and returns (boards,
+        pieces, rewards, dones).  The arrays are reused by the next call.
+        """
+        self.actions[:] = actions
+        if self.workers:
+            for connection, *_ in self.workers:
+                connection.send(("step", None))
+            for connection, *_ in self.workers:
+                connection.recv()
+        else:
+            VectorEnvironment.step_all(
+                self.environments, self.actions, self.rewards, self.dones, 0
+            )
+        return self.boards, self.pieces, self.rewards, self.dones
+
+    def close(self):
+        for connection, process, *_ in self.workers:
+            connection.send(("close", None))
+            process.join()
+        self.workers = []
+        if self.memory is not None:
+            # drop the views before releasing the memory they point into
+            self.rewards = self.pieces = self.actions = self.dones = None
+            self.boards = None
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+    @staticmethod
+    def reset_all(environments, seeds):
+        for environment, seed in zip(environments, seeds):
+            environment.reset(seed)
+
+    @staticmethod
+    def step_all(environments, actions, rewards, dones, start):
+        for i, environment in enumerate(environments, start):
+            _, rewards[i], dones[i], _ = environment.step(actions[i])
+            if dones[i]:
+                environment.reset()
+
+    @staticmethod
+    def work(name, size, shape, start, stop, frame_ms, connection):
+        """
+        Worker process loop running environments start to stop
+        """
+        memory = SharedMemory(name=name)
+        rewards, pieces, actions, dones, boards = VectorEnvironment.arrays(
+            memory.buf, size, shape
+        )
+        environments = VectorEnvironment.environments(
+            boards, pieces, start, stop, frame_ms
+        )
+        while True:
+            command, argument = connection.recv()
+            match command:
+                case "reset":
+                    VectorEnvironment.reset_all(environments, argument)
+                case "step":
+                    VectorEnvironment.step_all(
+                        environments, actions, rewards, dones, start
+                    )
+                case "close":
+                    break
+            connection.send(None)
+        environments = rewards = pieces = actions = dones = boards = None
+        memory.close()
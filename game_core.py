@@ -0,0 +1,502 @@
+from auto_shift import AutoShift
+from constants import Constants
+from timer import Scheduler, Timer
+from bisect import bisect_left
+from collections import defaultdict
+from enum import Enum
+from block import Block
+from board import Board
+from piece import Piece
+from piece_generator import PieceGenerator
+from piece_type import Orientation
+from game_state import GameState
+
+
+import random
+
+
+class State(Enum):
+    PLAYING = 1
+    GAME_OVER = 2
+    PAUSED = 3
+
+
+class Phase(Enum):
+    GENERATION = 1
+    FALLING = 2
+    LOCK = 3
+    PATTERN = 4
+    ELIMINATE = 5
+    COMPLETION = 6
+
+
+class ScoringActions(Enum):
+    SINGLE = 1
+    DOUBLE = 2
+    TRIPLE = 3
+    TETRIS = 4
+
+
+class Action(Enum):
+    LEFT = 1
+    RIGHT = 2
+    ROTATE_CW = 3
+    SOFT_DROP = 4
+    HARD_DROP = 5
+    HOLD = 6
+    PAUSE = 7
+    CONFIRM = 8
+
+
+class GameCore:
+    """
+    Display-free game logic.  The core is advanced with step(), which takes
+    the actions pressed and released since the last step and the number of
+    milliseconds that elapsed, so it can be driven by the pygame front end
+    in real time or stepped as fast as possible without a display.
+    """
+
+    DIRECTIONS = {Action.LEFT: AutoShift.LEFT, Action.RIGHT: AutoShift.RIGHT}
+
+    def __init__(
+        self,
+        seed=None,
+        auto_shift=None,
+        width=Constants.BOARD_WIDTH,
+        height=Constants.BOARD_HEIGHT,
+    ):
+        """
+        seed determines the piece sequence of every game played on this
+        core, so the same seed and inputs always replay the same session.
+        auto_shift is the AutoShift with the player's handling settings, and
+        width and height are the board dimensions.
+        """
+        self.seed = seed if seed is not None else random.getrandbits(32)
+        self.width = width
+        self.height = height
+        self.games = 0
+        self.scheduler = Scheduler()
+        self.auto_shift = auto_shift if auto_shift is not None else AutoShift()
+        self.state = State.PLAYING
+        self.init_game()
+
+    @staticmethod
+    def game_seed(seed, game):
+        """
+        Returns the piece generator seed of a game, a 64-bit hash of the
+        core's seed and the game number so that no two pairs share a piece
+        sequence
+        """
+        return random.Random(repr((seed, game))).getrandbits(64)
+
+    def init_game(self):
+        self.phase = Phase.GENERATION
+        self.piece_generator = PieceGenerator(GameCore.game_seed(self.seed, self.games))
+        self.games += 1
+        self.piece = None
+        self.ghost_piece = None
+        self.ghost_key = None
+        # board holds occupancy, blocks are only the rendering view of it
+        self.board = Board(self.width, self.height)
+        self.spawn = Piece.spawn_position(self.board)
+        self.blocks = []
+        self.board_snapshot_key = None
+        self.board_snapshot_value = None
+        self.auto_shift.reset()
+
+        self.held_piece = None
+        self.held_swapped = False
+
+        # scoring, levels, statistics
+        self.level = 1
+        self.score = 0
+        self.lines = 0
+        self.scoring_action = None
+
+        self.fall_speed = GameCore.fallspeed_from_level(self.level)
+        self.hit_list = []
+
+        # lockdown state:
+        # TODO: Implement extended placement (15 move limit before lockdown)
+        # lowest y coordinate hit by piece under lock down
+        self.lockdown_lowest_y = 0
+        self.under_lockdown = False
+
+        # timers
+
+        self.scheduler.clear()
+        self.fall_timer = Timer(self.scheduler)
+        self.lockdown_timer = Timer(self.scheduler)
+
+    def snapshot(self):
+        """
+        Returns a GameState capturing everything needed to resume this game
+        """
+        state = GameState()
+        state.now = self.scheduler.now
+        state.state = self.state.value
+        state.phase = self.phase.value
+        state.games = self.games
+
+        generator = self.piece_generator
+        state.generator_seed = generator.seed
+        state.generator_bags = generator.bags
+        state.bag = tuple(GameState.TYPE_INDEX[t.NAME] for t in generator.bag)
+
+        if self.piece is not None:
+            state.piece = (
+                GameState.TYPE_INDEX[self.piece.type.NAME],
+                self.piece.x,
+                self.piece.y,
+                self.piece.orientation.value,
+            )
+            state.piece_locked = not self.piece.blocks
+        if self.held_piece is not None:
+            state.held_piece = GameState.TYPE_INDEX[self.held_piece.NAME]
+        state.held_swapped = self.held_swapped
+
+        state.level = self.level
+        state.score = self.score
+        state.lines = self.lines
+        if self.scoring_action is not None:
+            state.scoring_action = self.scoring_action.value
+        state.fall_speed = self.fall_speed
+        state.hit_list = tuple(self.hit_list)
+
+        state.lockdown_lowest_y = self.lockdown_lowest_y
+        state.under_lockdown = self.under_lockdown
+        state.auto_shift = self.auto_shift.snapshot()
+        state.timers = tuple(timer.snapshot() for timer in self.timers())
+
+        state.width = self.board.width
+        state.height = self.board.height
+        state.rows, state.colors = self.board_snapshot()
+        return state
+
+    def board_snapshot(self):
+        """
+        Returns the rows and colors of a GameState for the locked blocks.
+        They are rebuilt only when the board has changed, so snapshots taken
+        while a piece falls share the same tuples.
+        """
+        board = self.board
+        key = (board, board.version)
+        if self.board_snapshot_key != key:
+            rows = board.rows[1:]
+            while rows and not rows[-1]:
+                rows.pop()
+            colors = [bytearray(board.width) for _ in rows]
+            for block in self.blocks:
+                colors[block.y - 1][block.x - 1] = (
+                    GameState.COLOR_INDEX[block.color] + 1
+                )
+            self.board_snapshot_key = key
+            self.board_snapshot_value = (
+                tuple(rows),
+                tuple(bytes(row) for row in colors),
+            )
+        return self.board_snapshot_value
+
+    def restore(self, state):
+        """
+        Replaces the current game with the one captured in a GameState
+        """
+        self.width = state.width
+        self.height = state.height
+        self.init_game()
+        self.games = state.games
+        self.scheduler.now = state.now
+        self.state = State(state.state)
+        self.phase = Phase(state.phase)
+
+        self.piece_generator = PieceGenerator(state.generator_seed)
+        self.piece_generator.bags = state.generator_bags
+        self.piece_generator.bag = [PieceGenerator.PIECES[i] for i in state.bag]
+
+        if state.piece is not None:
+            type_index, x, y, orientation = state.piece
+            self.piece = Piece(
+                PieceGenerator.PIECES[type_index], x, y, Orientation(orientation)
+            )
+            if state.piece_locked:
+                self.piece.blocks = []
+        if state.held_piece is not None:
+            self.held_piece = PieceGenerator.PIECES[state.held_piece]
+        self.held_swapped = state.held_swapped
+
+        self.level = state.level
+        self.score = state.score
+        self.lines = state.lines
+        if state.scoring_action is not None:
+            self.scoring_action = ScoringActions(state.scoring_action)
+        self.fall_speed = state.fall_speed
+        self.hit_list = list(state.hit_list)
+
+        self.lockdown_lowest_y = state.lockdown_lowest_y
+        self.under_lockdown = state.under_lockdown
+        self.auto_shift.restore(state.auto_shift)
+        for timer, snapshot in zip(self.timers(), state.timers):
+            timer.restore(snapshot)
+
+        self.blocks = [
+            Block(x, y, PieceGenerator.PIECES[color].color(), Block.Style.FILL)
+            for x, y, color in state.cells()
+        ]
+        self.board.lock((block.x, block.y) for block in self.blocks)
+        # the restored board hands back the state's own tuples until it changes
+        self.board_snapshot_key = (self.board, self.board.version)
+        self.board_snapshot_value = (state.rows, state.colors)
+        if self.phase == Phase.FALLING:
+            self.update_ghost()
+
+    def timers(self):
+        return [
+            self.fall_timer,
+            self.lockdown_timer,
+        ]
+
+    def update_ghost(self):
+        """
+        Moves the ghost piece to where the active piece would land.  The
+        landing row is only recomputed when the piece or board has changed.
+        """
+        piece = self.piece
+        key = (piece.type, piece.x, piece.y, piece.orientation, self.board.version)
+        if self.ghost_piece is not None and key == self.ghost_key:
+            return
+        y = self.board.drop_y(piece.shape, piece.x, piece.y)
+        if self.ghost_piece is None or self.ghost_piece.type is not piece.type:
+            self.ghost_piece = Piece(
+                piece.type,
+                x=piece.x,
+                y=y,
+                orientation=piece.orientation,
+                style=Block.Style.GHOST,
+            )
+        else:
+            self.ghost_piece.move_to(piece.x, y, piece.orientation)
+        self.ghost_key = key
+
+    def fall_progress(self, ahead=0):
+        """
+        Returns how far the falling piece is towards the next row, ahead
+        ticks from now, between 0 and 1.  Renderers running faster than the
+        game is stepped use it to glide the piece down between steps.
+        """
+        if self.phase != Phase.FALLING or not self.piece.can_fall(self.board):
+            return 0
+        return self.fall_timer.progress(ahead)
+
+    def ticks_until_next_timer(self):
+        """
+        Returns the number of ticks until the next timer elapses, or 0 if no
+        timer is running.  A headless driver with no pending input can step
+        by this amount to fast-forward without changing the outcome.
+        """
+        deadline = self.scheduler.next_deadline()
+        return 0 if deadline is None else deadline - self.scheduler.now
+
+    def fast_forward(self):
+        """
+        Steps straight to the next timer event without any input
+        """
+        self.step((), self.ticks_until_next_timer())
+
+    def step(self, inputs=(), dt=0):
+        """
+        Advances the game by dt ticks (milliseconds).  inputs is an iterable
+        of (Action, pressed) pairs, where pressed is true for a key down and
+        false for a key up.
+        """
+        falls = self.fall_timer.elapsed
+        fired = self.scheduler.advance(dt)
+        # gravity faster than the step elapses the fall timer several times
+        falls = self.fall_timer.elapsed - falls
+
+        keys_down = defaultdict(bool)
+        keys_up = defaultdict(bool)
+        for action, pressed in inputs:
+            if pressed:
+                keys_down[action] = True
+            else:
+                keys_up[action] = True
+
+        locked = self.lockdown_timer in fired
+
+        if self.state == State.PLAYING:
+            auto_shift = self.auto_shift
+            # repeats of the direction held through this step
+            shift = auto_shift.advance(dt)
+            if keys_down[Action.SOFT_DROP]:
+                self.fall_speed = auto_shift.soft_drop_speed(
+                    GameCore.fallspeed_from_level(self.level)
+                )
+            if keys_up[Action.SOFT_DROP]:
+                self.fall_speed = GameCore.fallspeed_from_level(self.level)
+            # directions are pressed and released in the order received, so
+            # a tap within one step leaves nothing held
+            for action, pressed in inputs:
+                if action in GameCore.DIRECTIONS:
+                    if pressed:
+                        auto_shift.press(GameCore.DIRECTIONS[action])
+                    else:
+                        auto_shift.release(GameCore.DIRECTIONS[action])
+
+            if keys_down[Action.PAUSE]:
+                self.fall_timer.pause()
+                self.lockdown_timer.pause()
+                self.state = State.PAUSED
+                return
+
+            match self.phase:
+                case Phase.GENERATION:
+                    self.piece = self.piece_generator.next(*self.spawn)
+                    self.held_swapped = False
+                    # check top out conditions
+                    if not self.piece.can_fall(self.board) or self.piece.is_blocked(
+                        self.board
+                    ):
+                        self.state = State.GAME_OVER
+                    else:
+                        self.piece.fall(self.board)
+                        self.phase = Phase.FALLING
+                        self.fall_timer.start(self.fall_speed)
+                case Phase.FALLING | Phase.LOCK:
+                    if shift:
+                        self.piece.shift(self.board, shift)
+                    if keys_down[Action.LEFT]:
+                        self.piece.move_left(self.board)
+                    if keys_down[Action.RIGHT]:
+                        self.piece.move_right(self.board)
+                    if keys_down[Action.LEFT] or keys_down[Action.RIGHT]:
+                        self.piece.shift(self.board, auto_shift.advance(0))
+
+                    if keys_down[Action.ROTATE_CW]:
+                        self.piece.rotate_cw(self.board)
+
+                    if keys_down[Action.SOFT_DROP] or keys_up[Action.SOFT_DROP]:
+                        self.fall_timer.start(self.fall_speed)
+
+                    if keys_down[Action.HOLD] and not self.held_swapped:
+                        if self.held_piece:
+                            self.piece, self.held_piece = (
+                                Piece(self.held_piece, *self.spawn),
+                                self.piece.type,
+                            )
+                        else:
+                            self.piece, self.held_piece = (
+                                self.piece_generator.next(*self.spawn),
+                                self.piece.type,
+                            )
+                        self.held_swapped = True
+
+                    if self.phase == Phase.FALLING:
+                        self.update_ghost()
+
+                    if keys_down[Action.HARD_DROP]:
+                        self.piece.drop(self.board)
+                        self.fall_timer.stop()
+                        self.phase = Phase.PATTERN
+                        return
+
+                    # falls one row per elapse, locking if any is blocked
+                    if falls and not all(
+                        self.piece.fall(self.board) for _ in range(falls)
+                    ):
+                        self.fall_timer.stop()
+                        if not self.under_lockdown:
+                            self.lockdown_lowest_y = self.piece.y
+                            self.lockdown_timer.start(Constants.LOCKDOWN_DELAY_MS, 1)
+                        else:
+                            self.lockdown_timer.resume()
+                        self.phase = Phase.LOCK
+
+                    if self.phase == Phase.LOCK:
+                        self.ghost_piece = None
+                        # Movement or rotation can cause piece to continue falling
+                        # if piece can fall, pause timer until piece lands on a surface
+                        # if piece falls below lowest previously hit y coordinate, reset lockdown
+                        if self.piece.can_fall(self.board):
+                            if self.piece.y - 1 < self.lockdown_lowest_y:
+                                self.under_lockdown = False
+                                self.lockdown_timer.stop()
+                            else:
+                                self.lockdown_timer.pause()
+                            self.fall_timer.start(self.fall_speed)
+                            self.phase = Phase.FALLING
+
+                        if locked:
+                            self.under_lockdown = False
+                            self.phase = Phase.PATTERN
+                case Phase.PATTERN:
+                    self.board.lock((block.x, block.y) for block in self.piece.blocks)
+                    self.blocks.extend(self.piece.blocks)
+                    self.piece.blocks = []
+                    self.hit_list = self.board.full_rows()
+                    self.phase = Phase.ELIMINATE
+                case Phase.ELIMINATE:
+                    eliminated_rows = set(self.hit_list)
+                    self.hit_list = []
+                    if eliminated_rows:
+                        self.board.eliminate(eliminated_rows)
+                        # single pass: each block drops by the number of
+                        # eliminated rows beneath it
+                        ordered_rows = sorted(eliminated_rows)
+                        remaining = []
+                        for block in self.blocks:
+                            if block.y not in eliminated_rows:
+                                block.y -= bisect_left(ordered_rows, block.y)
+                                remaining.append(block)
+                        self.blocks = remaining
+
+                    if len(eliminated_rows) == 1:
+                        self.scoring_action = ScoringActions.SINGLE
+                    elif len(eliminated_rows) == 2:
+                        self.scoring_action = ScoringActions.DOUBLE
+                    elif len(eliminated_rows) == 3:
+                        self.scoring_action = ScoringActions.TRIPLE
+                    elif len(eliminated_rows) == 4:
+                        self.scoring_action = ScoringActions.TETRIS
+
+                    self.lines += len(eliminated_rows)
+
+                    self.phase = Phase.COMPLETION
+                case Phase.COMPLETION:
+                    match self.scoring_action:
+                        case ScoringActions.SINGLE:
+                            self.score += 100
+                        case ScoringActions.DOUBLE:
+                            self.score += 300
+                        case ScoringActions.TRIPLE:
+                            self.score += 500
+                        case ScoringActions.TETRIS:
+                            self.score += 800
+
+                    if (
+                        self.level < Constants.MAX_LEVEL
+                        and self.lines >= self.level * 10
+                    ):
+                        self.level += 1
+                        self.fall_speed = GameCore.fallspeed_from_level(self.level)
+
+                    self.scoring_action = None
+                    self.phase = Phase.GENERATION
+
+        elif self.state == State.PAUSED:
+            if keys_down[Action.CONFIRM] or keys_down[Action.PAUSE]:
+                self.fall_timer.resume()
+                self.lockdown_timer.resume()
+                self.state = State.PLAYING
+
+        elif self.state == State.GAME_OVER:
+            self.fall_timer.stop()
+            self.lockdown_timer.stop()
+            self.auto_shift.reset()
+
+            if keys_down[Action.CONFIRM]:
+                self.init_game()
+                self.state = State.PLAYING
+
+    @staticmethod
+    def fallspeed_from_level(level):
+        return int((0.8 - (level - 1) * 0.007) ** (level - 1) * 1000)
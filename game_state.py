@@ -0,0 +1,256 @@
+from piece_generator import PieceGenerator
+from varint import Varint
+
+
+class GameState:
+    """
+    Compact snapshot of everything needed to resume a GameCore.  The board
+    is stored as row bitmasks plus a color index per cell, pieces as type
+    indices into PieceGenerator.PIECES, and every container is an immutable
+    tuple or bytes object.  That makes clone() a shallow copy: clones share
+    rows, colors and bag until one of them is given new ones, so many search
+    branches can hold states cheaply.
+    """
+
+    TYPE_INDEX = {
+        piece_type.NAME: i for i, piece_type in enumerate(PieceGenerator.PIECES)
+    }
+    COLOR_INDEX = {
+        piece_type.color(): i for i, piece_type in enumerate(PieceGenerator.PIECES)
+    }
+
+    __slots__ = (
+        "now",
+        "state",
+        "phase",
+        "games",
+        "generator_seed",
+        "generator_bags",
+        "bag",
+        "piece",
+        "piece_locked",
+        "held_piece",
+        "held_swapped",
+        "level",
+        "score",
+        "lines",
+        "scoring_action",
+        "fall_speed",
+        "hit_list",
+        "lockdown_lowest_y",
+        "under_lockdown",
+        "auto_shift",
+        "timers",
+        "width",
+        "height",
+        "rows",
+        "colors",
+    )
+
+    def __init__(self):
+        self.now = 0
+        # State, Phase and ScoringActions values
+        self.state = None
+        self.phase = None
+        self.games = 0
+
+        # generator seed, bags dealt and the remaining bag as type indices
+        self.generator_seed = 0
+        self.generator_bags = 0
+        self.bag = ()
+
+        # active piece as (type index, x, y, orientation value) or None, and
+        # whether its blocks have already been moved onto the board
+        self.piece = None
+        self.piece_locked = False
+        self.held_piece = None
+        self.held_swapped = False
+
+        self.level = 1
+        self.score = 0
+        self.lines = 0
+        self.scoring_action = None
+        self.fall_speed = 0
+        self.hit_list = ()
+
+        self.lockdown_lowest_y = 0
+        self.under_lockdown = False
+        # AutoShift.snapshot() of the handling settings and held direction
+        self.auto_shift = ()
+
+        # Timer.snapshot() of the fall and lockdown timers
+        self.timers = ()
+
+        # rows[y - 1] is the bitmask of row y, up to the highest filled row,
+        # and colors[y - 1][x - 1] is 1 + the type index of the block at
+        # (x, y) or 0 if the cell is empty
+        self.width = 0
+        self.height = 0
+        self.rows = ()
+        self.colors = ()
+
+    def clone(self):
+        state = GameState.__new__(GameState)
+        for name in GameState.__slots__:
+            setattr(state, name, getattr(self, name))
+        return state
+
+    def cells(self):
+        """
+        Yields (x, y, type index) for every locked block
+        """
+        for y, colors in enumerate(self.colors, 1):
+            for x, color in enumerate(colors, 1):
+                if color:
+                    yield x, y, color - 1
+
+    def to_bytes(self):
+        data = bytearray()
+        for value in (
+            self.now,
+            self.state,
+            self.phase,
+            self.games,
+            self.generator_seed,
+            self.generator_bags,
+        ):
+            Varint.write(data, value)
+        GameState.__write_list(data, self.bag)
+
+        Varint.write(data, 0 if self.piece is None else 1)
+        if self.piece is not None:
+            type_index, x, y, orientation = self.piece
+            Varint.write(data, type_index)
+            Varint.write_signed(data, x)
+            Varint.write_signed(data, y)
+            Varint.write(data, orientation)
+        Varint.write(data, self.piece_locked)
+        Varint.write_optional(data, self.held_piece)
+        Varint.write(data, self.held_swapped)
+
+        for value in (self.level, self.score, self.lines):
+            Varint.write(data, value)
+        Varint.write_optional(data, self.scoring_action)
+        Varint.write(data, self.fall_speed)
+        GameState.__write_list(data, self.hit_list)
+
+        Varint.write_signed(data, self.lockdown_lowest_y)
+        Varint.write(data, self.under_lockdown)
+        das, arr, soft_drop_factor, direction, charge, repeats = self.auto_shift
+        for value in (das, arr, soft_drop_factor):
+            Varint.write(data, value)
+        Varint.write_signed(data, direction)
+        for value in (charge, repeats):
+            Varint.write(data, value)
+
+        Varint.write(data, len(self.timers))
+        for timer in self.timers:
+            for value in timer:
+                Varint.write_optional(data, value)
+
+        # rows as bitmasks, then the color of each filled cell in row order
+        # packed two to a byte
+        Varint.write(data, self.width)
+        Varint.write(data, self.height)
+        GameState.__write_list(data, self.rows)
+        colors = [color - 1 for row in self.colors for color in row if color]
+        colors.append(0)
+        data += bytes(
+            colors[i] | colors[i + 1] << 4 for i in range(0, len(colors) - 1, 2)
+        )
+        return bytes(data)
+
+    @staticmethod
+    def from_bytes(data, pos=0):
+        """
+        Returns the state encoded at pos and the position after it
+        """
+        state = GameState()
+        (
+            state.now,
+            state.state,
+            state.phase,
+            state.games,
+            state.generator_seed,
+            state.generator_bags,
+        ), pos = GameState.__read_values(data, pos, 6)
+        state.bag, pos = GameState.__read_list(data, pos)
+
+        has_piece, pos = Varint.read(data, pos)
+        if has_piece:
+            type_index, pos = Varint.read(data, pos)
+            x, pos = Varint.read_signed(data, pos)
+            y, pos = Varint.read_signed(data, pos)
+            orientation, pos = Varint.read(data, pos)
+            state.piece = (type_index, x, y, orientation)
+        piece_locked, pos = Varint.read(data, pos)
+        state.piece_locked = bool(piece_locked)
+        state.held_piece, pos = Varint.read_optional(data, pos)
+        held_swapped, pos = Varint.read(data, pos)
+        state.held_swapped = bool(held_swapped)
+
+        (state.level, state.score, state.lines), pos = GameState.__read_values(
+            data, pos, 3
+        )
+        state.scoring_action, pos = Varint.read_optional(data, pos)
+        state.fall_speed, pos = Varint.read(data, pos)
+        state.hit_list, pos = GameState.__read_list(data, pos)
+
+        state.lockdown_lowest_y, pos = Varint.read_signed(data, pos)
+        under_lockdown, pos = Varint.read(data, pos)
+        state.under_lockdown = bool(under_lockdown)
+        settings, pos = GameState.__read_values(data, pos, 3)
+        direction, pos = Varint.read_signed(data, pos)
+        held, pos = GameState.__read_values(data, pos, 2)
+        state.auto_shift = (*settings, direction, *held)
+
+        count, pos = Varint.read(data, pos)
+        timers = []
+        for _ in range(count):
+            timer, pos = GameState.__read_optionals(data, pos, 4)
+            timers.append(timer)
+        state.timers = tuple(timers)
+
+        state.width, pos = Varint.read(data, pos)
+        state.height, pos = Varint.read(data, pos)
+        state.rows, pos = GameState.__read_list(data, pos)
+        nibble = 0
+        colors = []
+        for row in state.rows:
+            row_colors = bytearray(state.width)
+            for x in range(state.width):
+                if row >> x & 1:
+                    byte = data[pos + nibble // 2]
+                    row_colors[x] = (byte >> nibble % 2 * 4 & 0xF) + 1
+                    nibble += 1
+            colors.append(bytes(row_colors))
+        state.colors = tuple(colors)
+        pos += (nibble + 1) // 2
+        return state, pos
+
+    @staticmethod
+    def __write_list(data, values):
+        Varint.write(data, len(values))
+        for value in values:
+            Varint.write(data, value)
+
+    @staticmethod
+    def __read_list(data, pos):
+        count, pos = Varint.read(data, pos)
+        return GameState.__read_values(data, pos, count)
+
+    @staticmethod
+    def __read_values(data, pos, count):
+        values = []
+        for _ in range(count):
+            value, pos = Varint.read(data, pos)
+            values.append(value)
+        return tuple(values), pos
+
+    @staticmethod
+    def __read_optionals(data, pos, count):
+        values = []
+        for _ in range(count):
+            value, pos = Varint.read_optional(data, pos)
+            values.append(value)
+        return tuple(values), pos
@@ -1,398 +1,472 @@
 import pygame
+from auto_shift import AutoShift
 from constants import Constants
-from timer import Timer
-from collections import defaultdict
-from enum import Enum
-from block import Block
+from game_core import GameCore, State, Phase, Action
 from piece import Piece
-from piece_generator import PieceGenerator
+from profiler import Profiler
+from replay import ReplayRecorder
+from bot import Bot
 
 
-class State(Enum):
-    PLAYING = 1
-    GAME_OVER = 2
-    PAUSED = 3
-
-
-class Phase(Enum):
-    GENERATION = 1
-    FALLING = 2
-    LOCK = 3
-    PATTERN = 4
-    ELIMINATE = 5
-    COMPLETION = 6
-
-
-class ScoringActions(Enum):
-    SINGLE = 1
-    DOUBLE = 2
-    TRIPLE = 3
-    TETRIS = 4
+import argparse
 
 
 class Game:
-    def __init__(self):
+    KEY_BINDINGS = {
+        pygame.K_LEFT: Action.LEFT,
+        pygame.K_RIGHT: Action.RIGHT,
+        pygame.K_UP: Action.ROTATE_CW,
+        pygame.K_DOWN: Action.SOFT_DROP,
+        pygame.K_SPACE: Action.HARD_DROP,
+        pygame.K_LSHIFT: Action.HOLD,
+        pygame.K_p: Action.PAUSE,
+        pygame.K_RETURN: Action.CONFIRM,
+    }
+
+    PROFILE_TOGGLE_KEY = pygame.K_F3
+    PROFILE_DUMP_KEY = pygame.K_F4
+
+    BOARD_POSITION = (240, 0)
+    HUD_RECT = pygame.Rect(0, 0, 240, 80)
+    HOLD_POSITION = (40, 600)
+    NEXT_POSITION = (680, 100)
+    PROFILE_RECT = pygame.Rect(640, 280, 240, 520)
+    # boards larger than the standard one are drawn through a view of that
+    # size, which scrolls to keep the active piece this many cells inside it
+    VIEW_MARGIN = 3
+
+    # the game is stepped every TICK_MS, like the bot and environments step
+    # it, while frames are drawn as often as fps allows
+    TICK_MS = 16
+    # longest stretch of game time caught up on in one frame, so a stall
+    # does not leave the game running fixed steps for ever
+    MAX_CATCH_UP_MS = 250
+
+    # core.step is timed under the phase it starts in
+    PHASE_SECTIONS = {phase: f"step.{phase.name.lower()}" for phase in Phase}
+    FRAME_BUDGET_MS = 1000 / 60
+    # frames between refreshes of the profiler overlay
+    PROFILE_REFRESH_FRAMES = 30
+
+    # piece type name -> rendered hold/next queue preview
+    THUMBNAILS = {}
+
+    def __init__(
+        self,
+        seed=None,
+        record_path=None,
+        bot=None,
+        show_profile=False,
+        profile_path="profile.json",
+        fps=240,
+        auto_shift=None,
+        width=Constants.BOARD_WIDTH,
+        height=Constants.BOARD_HEIGHT,
+    ):
+        """
+        If a Bot is given it plays in place of the keyboard.  Frame times are
+        always profiled; the overlay is toggled with F3 and F4 writes the
+        profile to profile_path.  fps caps the frame rate, 0 for no cap.
+        auto_shift is an AutoShift with the player's handling settings, and
+        width and height are the board dimensions.
+        """
         self.screen = pygame.display.set_mode(
             (Constants.SCREEN_WIDTH, Constants.SCREEN_HEIGHT)
         )
-        self.board = pygame.Surface(
-            (
-                Constants.BOARD_WIDTH * Constants.BLOCK_WIDTH,
-                Constants.BOARD_HEIGHT * Constants.BLOCK_HEIGHT,
-            )
+        # columns and rows in view, and the (left column, top row) in view
+        self.view_size = (
+            min(width, Constants.BOARD_WIDTH),
+            min(height, Constants.BOARD_HEIGHT),
+        )
+        self.view = (1, height)
+        board_size = (
+            self.view_size[0] * Constants.BLOCK_WIDTH,
+            self.view_size[1] * Constants.BLOCK_HEIGHT,
+        )
+        # static grid and frame, drawn once
+        self.background = pygame.Surface(board_size)
+        Game.draw_board(self.background)
+        # background plus locked blocks, redrawn only when the board changes
+        self.board_surface = pygame.Surface(board_size)
+        # view of the screen covering the board, for drawing in board coordinates
+        self.board_view = self.screen.subsurface(
+            pygame.Rect(Game.BOARD_POSITION, board_size)
         )
         self.font = pygame.font.SysFont(pygame.font.get_default_font(), 24)
         self.big_font = pygame.font.SysFont(pygame.font.get_default_font(), 64)
+        self.small_font = pygame.font.SysFont(pygame.font.get_default_font(), 18)
         self.clock = pygame.time.Clock()
-        self.state = State.PLAYING
-        self.init_game()
-
-    def init_game(self):
-        self.phase = Phase.GENERATION
-        self.piece_generator = PieceGenerator()
-        self.piece = None
-        self.ghost_piece = None
-        self.blocks = pygame.sprite.Group()
+        self.fps = fps
+        # game time that has passed but not been stepped yet
+        self.accumulator = 0
         self.running = True
-        self.auto_repeat_left = False
-        self.auto_repeat_right = False
-
-        self.held_piece = None
-        self.held_swapped = False
-
-        # scoring, levels, statistics
-        self.level = 1
-        self.score = 0
-        self.lines = 0
-        self.scoring_action = None
-
-        self.fall_speed = Game.fallspeed_from_level(self.level)
-        self.hit_list = []
-
-        # lockdown state:
-        # TODO: Implement extended placement (15 move limit before lockdown)
-        # lowest y coordinate hit by piece under lock down
-        self.lockdown_lowest_y = 0
-        self.under_lockdown = False
-
-        # timers
-
-        self.fall_timer = Timer(Constants.FALL_EVENT)
-        self.lockdown_timer = Timer(Constants.LOCKDOWN_EVENT)
-        self.left_auto_timer = Timer(Constants.LEFT_AUTO_REPEAT_EVENT)
-        self.right_auto_timer = Timer(Constants.RIGHT_AUTO_REPEAT_EVENT)
+        self.core = GameCore(seed, auto_shift, width, height)
+        self.record_path = record_path
+        self.recorder = ReplayRecorder(self.core) if record_path else None
+        self.bot = bot
+        self.profiler = Profiler()
+        self.show_profile = show_profile
+        self.profile_path = profile_path
+        self.profile_status = None
+
+        # what is currently on screen, used to find the dirty regions
+        self.drawn_state = None
+        self.drawn_board = None
+        self.drawn_board_version = None
+        self.drawn_view = None
+        self.drawn_piece_rects = []
+        # locked blocks by row, rebuilt when the board changes, so drawing
+        # the view only visits the rows in it
+        self.block_rows = {}
+        self.block_rows_key = None
+        self.drawn_hud = None
+        self.drawn_queues = None
+
+        # rendered text and overlays, reused until their contents change
+        self.hud_text = {}
+        self.pause_overlay = None
+        self.game_over_overlay = None
+        self.profile_overlay = None
+        self.profile_overlay_frame = 0
 
     def run(self):
         while self.running:
             self.loop()
+        if self.recorder:
+            self.recorder.save(self.record_path)
+        self.profiler.close()
         pygame.quit()
 
+    def snapshot(self):
+        return self.core.snapshot()
+
+    def restore(self, state):
+        """
+        Resumes the game captured in a GameState and redraws everything on
+        the next frame
+        """
+        self.core.restore(state)
+        self.drawn_state = None
+
     def loop(self):
-        falling = False
-        locked = False
-        keys_down = defaultdict(bool)
-        keys_up = defaultdict(bool)
-        for event in pygame.event.get():
-            match event.type:
-                case pygame.QUIT:
-                    self.running = False
-                case pygame.KEYDOWN:
-                    if event.key == pygame.K_ESCAPE:
+        """
+        Runs one frame: polls input, steps the game and draws it.  The game
+        advances in fixed TICK_MS steps as the frame time accumulates, but
+        input is applied as soon as it is polled, in one more step over the
+        time left after the fixed steps, so it is not held back to the next
+        step and never skips falls that happened before it.  Drawing then
+        interpolates the falling piece over the time that has not been
+        stepped yet.
+        """
+        profiler = self.profiler
+        profiler.begin_frame()
+        self.accumulator = min(
+            self.accumulator + self.clock.get_time(), Game.MAX_CATCH_UP_MS
+        )
+        inputs = []
+        with profiler.section("events"):
+            for event in pygame.event.get():
+                match event.type:
+                    case pygame.QUIT:
                         self.running = False
-                    keys_down[event.key] = True
-                case pygame.KEYUP:
-                    keys_up[event.key] = True
-                case Constants.FALL_EVENT:
-                    falling = True
-                    self.fall_timer.notify()
-                case Constants.LOCKDOWN_EVENT:
-                    locked = True
-                case Constants.LEFT_AUTO_REPEAT_EVENT:
-                    self.auto_repeat_left = True
-                case Constants.RIGHT_AUTO_REPEAT_EVENT:
-                    self.auto_repeat_right = True
-
-        if self.state == State.PLAYING:
-            if keys_down[pygame.K_DOWN]:
-                self.fall_speed = Game.fallspeed_from_level(self.level) // 20
-            if keys_up[pygame.K_DOWN]:
-                self.fall_speed = Game.fallspeed_from_level(self.level)
-            if keys_up[pygame.K_RIGHT]:
-                self.right_auto_timer.stop()
-                self.auto_repeat_right = False
-            if keys_up[pygame.K_LEFT]:
-                self.left_auto_timer.stop()
-                self.auto_repeat_left = False
-
-            if keys_down[pygame.K_p]:
-                self.fall_timer.pause()
-                self.lockdown_timer.pause()
-                self.left_auto_timer.pause()
-                self.right_auto_timer.pause()
-                self.state = State.PAUSED
-                return
-
-            match self.phase:
-                case Phase.GENERATION:
-                    self.piece = self.piece_generator.next()
-                    self.held_swapped = False
-                    # check top out conditions
-                    if not self.piece.can_fall(self.blocks) or self.piece.is_blocked(
-                        self.blocks
-                    ):
-                        self.state = State.GAME_OVER
-                    else:
-                        self.piece.fall(self.blocks)
-                        self.phase = Phase.FALLING
-                        self.fall_timer.start(self.fall_speed)
-                case Phase.FALLING | Phase.LOCK:
-                    if keys_down[pygame.K_LEFT]:
-                        self.piece.move_left(self.blocks)
-                        self.left_auto_timer.start(Constants.AUTO_REPEAT_DELAY_MS, 1)
-
-                        # cancel any pre-existing right auto repeat
-                        self.right_auto_timer.stop()
-                        self.auto_repeat_right = False
-                    elif self.auto_repeat_left:
-                        self.piece.move_left(self.blocks)
-
-                    if keys_down[pygame.K_RIGHT]:
-                        self.piece.move_right(self.blocks)
-                        self.right_auto_timer.start(Constants.AUTO_REPEAT_DELAY_MS, 1)
-                        # cancel any pre-existing left auto repeat
-                        self.left_auto_timer.stop()
-                        self.auto_repeat_left = False
-                    elif self.auto_repeat_right:
-                        self.piece.move_right(self.blocks)
-
-                    if keys_down[pygame.K_UP]:
-                        self.piece.rotate_cw(self.blocks)
-
-                    if keys_down[pygame.K_DOWN] or keys_up[pygame.K_DOWN]:
-                        self.fall_timer.start(self.fall_speed)
-
-                    if keys_down[pygame.K_LSHIFT] and not self.held_swapped:
-                        if self.held_piece:
-                            self.piece, self.held_piece = (
-                                Piece(self.held_piece),
-                                self.piece.type,
-                            )
-                        else:
-                            self.piece, self.held_piece = (
-                                self.piece_generator.next(),
-                                self.piece.type,
-                            )
-                        self.held_swapped = True
-
-                    if self.phase == Phase.FALLING:
-                        self.ghost_piece = Piece(
-                            self.piece.type,
-                            x=self.piece.x,
-                            y=self.piece.y,
-                            orientation=self.piece.orientation,
-                            style=Block.Style.GHOST,
-                        )
-                        while self.ghost_piece.fall(self.blocks):
-                            pass
-
-                    if keys_down[pygame.K_SPACE]:
-                        while self.piece.fall(self.blocks):
-                            pass
-                        self.fall_timer.stop()
-                        self.phase = Phase.PATTERN
-                        return
-
-                    if falling and not self.piece.fall(self.blocks):
-                        self.fall_timer.stop()
-                        if not self.under_lockdown:
-                            self.lockdown_lowest_y = self.piece.y
-                            self.lockdown_timer.start(Constants.LOCKDOWN_DELAY_MS, 1)
-                        else:
-                            self.lockdown_timer.resume()
-                        self.phase = Phase.LOCK
-
-                    if self.phase == Phase.LOCK:
-                        self.ghost_piece = None
-                        # Movement or rotation can cause piece to continue falling
-                        # if piece can fall, pause timer until piece lands on a surface
-                        # if piece falls below lowest previously hit y coordinate, reset lockdown
-                        if self.piece.can_fall(self.blocks):
-                            if self.piece.y - 1 < self.lockdown_lowest_y:
-                                self.under_lockdown = False
-                                self.lockdown_timer.stop()
-                            else:
-                                self.lockdown_timer.pause()
-                            self.fall_timer.start(self.fall_speed)
-                            self.phase = Phase.FALLING
-
-                        if locked:
-                            self.under_lockdown = False
-                            self.phase = Phase.PATTERN
-                case Phase.PATTERN:
-                    self.blocks.add(*self.piece.blocks.sprites())
-                    self.piece.blocks.empty()
-                    for row in range(Constants.BOARD_HEIGHT):
-                        block_row = [block for block in self.blocks if block.y == row]
-                        if len(block_row) == Constants.BOARD_WIDTH:
-                            self.hit_list.extend(block_row)
-                    self.phase = Phase.ELIMINATE
-                case Phase.ELIMINATE:
-                    eliminated_rows = set(block.y for block in self.hit_list)
-                    for block in self.hit_list:
-                        block.kill()
-                    self.hit_list = []
-                    for eliminated_row in sorted(eliminated_rows, reverse=True):
-                        for block in self.blocks:
-                            if block.y > eliminated_row:
-                                block.fall()
-
-                    if len(eliminated_rows) == 1:
-                        self.scoring_action = ScoringActions.SINGLE
-                    elif len(eliminated_rows) == 2:
-                        self.scoring_action = ScoringActions.DOUBLE
-                    elif len(eliminated_rows) == 3:
-                        self.scoring_action = ScoringActions.TRIPLE
-                    elif len(eliminated_rows) == 4:
-                        self.scoring_action = ScoringActions.TETRIS
-
-                    self.lines += len(eliminated_rows)
-
-                    self.phase = Phase.COMPLETION
-                case Phase.COMPLETION:
-                    match self.scoring_action:
-                        case ScoringActions.SINGLE:
-                            self.score += 100
-                        case ScoringActions.DOUBLE:
-                            self.score += 300
-                        case ScoringActions.TRIPLE:
-                            self.score += 500
-                        case ScoringActions.TETRIS:
-                            self.score += 800
-
-                    if (
-                        self.level < Constants.MAX_LEVEL
-                        and self.lines >= self.level * 10
-                    ):
-                        self.level += 1
-                        self.fall_speed = Game.fallspeed_from_level(self.level)
-
-                    self.scoring_action = None
-                    self.phase = Phase.GENERATION
-
-        elif self.state == State.PAUSED:
-            if keys_down[pygame.K_RETURN] or keys_down[pygame.K_p]:
-                self.fall_timer.resume()
-                self.lockdown_timer.resume()
-                self.left_auto_timer.resume()
-                self.right_auto_timer.resume()
-                self.state = State.PLAYING
-
-        elif self.state == State.GAME_OVER:
-            self.fall_timer.stop()
-            self.lockdown_timer.stop()
-            self.left_auto_timer.stop()
-            self.right_auto_timer.stop()
-
-            if keys_down[pygame.K_RETURN]:
-                self.init_game()
-                self.state = State.PLAYING
-                return
-
-        self.screen.fill(pygame.Color("black"))
-        Game.draw_board(self.board)
-        if self.ghost_piece:
-            self.ghost_piece.draw(self.board)
-        self.piece.draw(self.board)
-        [block.draw(self.board) for block in self.blocks.sprites()]
-        self.screen.blit(self.board, (240, 0))
-        Game.draw_hold_queue(self.screen, self.held_piece)
-        Game.draw_next_queue(self.screen, self.piece_generator.peek())
-
-        level = self.font.render(f"Level: {self.level}", True, (255, 255, 255))
-        score = self.font.render(f"Score: {self.score}", True, (255, 255, 255))
-        lines = self.font.render(f"Lines: {self.lines}", True, (255, 255, 255))
-        self.screen.blit(level, (10, 10))
-        self.screen.blit(score, (10, 30))
-        self.screen.blit(lines, (10, 50))
-
-        if self.state == State.GAME_OVER:
-            Game.draw_game_over_overlay(self.screen, self.big_font, self.font)
-        elif self.state == State.PAUSED:
-            Game.draw_pause_overlay(self.screen, self.big_font)
-
-        self.clock.tick(60)
-        pygame.display.flip()
+                    case pygame.KEYDOWN:
+                        if event.key == pygame.K_ESCAPE:
+                            self.running = False
+                        elif event.key == Game.PROFILE_TOGGLE_KEY:
+                            self.show_profile = not self.show_profile
+                            # redraw everything to show or clear the overlay
+                            self.drawn_state = None
+                        elif event.key == Game.PROFILE_DUMP_KEY:
+                            profiler.dump(self.profile_path)
+                            # shown at the foot of the overlay, which is
+                            # opened if it was hidden
+                            self.profile_status = f"saved to {self.profile_path}"
+                            self.profile_overlay = None
+                            self.show_profile = True
+                            self.drawn_state = None
+                        if event.key in Game.KEY_BINDINGS and not self.bot:
+                            inputs.append((Game.KEY_BINDINGS[event.key], True))
+                    case pygame.KEYUP:
+                        if event.key in Game.KEY_BINDINGS and not self.bot:
+                            inputs.append((Game.KEY_BINDINGS[event.key], False))
+
+        while self.accumulator >= Game.TICK_MS:
+            bot_inputs = ()
+            if self.bot:
+                # the bot plays one key per step, so it is asked every step
+                with profiler.section("bot"):
+                    bot_inputs = self.bot.inputs(self.core)
+            self.step(bot_inputs, Game.TICK_MS)
+            self.accumulator -= Game.TICK_MS
+        if inputs:
+            self.step(inputs, self.accumulator)
+            self.accumulator = 0
+
+        core = self.core
+        self.view = self.viewport()
+        if (
+            core.state != self.drawn_state
+            or core.board is not self.drawn_board
+            or core.board.version != self.drawn_board_version
+            or self.view != self.drawn_view
+        ):
+            dirty = self.draw_all()
+        elif core.state == State.PLAYING:
+            dirty = self.draw_changes()
+        else:
+            # nothing moves under the pause and game over overlays
+            dirty = []
+
+        with profiler.section("display.update"):
+            pygame.display.update(dirty)
+        profiler.end_frame()
+        # waiting for the next frame is not part of the frame time
+        self.clock.tick(self.fps)
+
+    def step(self, inputs, dt):
+        if self.recorder:
+            self.recorder.record(inputs, dt)
+        with self.profiler.section(Game.PHASE_SECTIONS[self.core.phase]):
+            self.core.step(inputs, dt)
+
+    def draw_all(self):
+        """
+        Redraws the whole screen, rebuilding the locked block layer.  Returns
+        the dirty regions.
+        """
+        core = self.core
+        profiler = self.profiler
+        with profiler.section("draw.board"):
+            self.board_surface.blit(self.background, (0, 0))
+        with profiler.section("draw.blocks"):
+            self.draw_blocks()
+        self.drawn_state = core.state
+        self.drawn_board = core.board
+        self.drawn_board_version = core.board.version
+        self.drawn_view = self.view
+
+        with profiler.section("draw.board"):
+            self.screen.fill(pygame.Color("black"))
+            self.board_view.blit(self.board_surface, (0, 0))
+        with profiler.section("draw.pieces"):
+            self.drawn_piece_rects = self.draw_pieces()
+        with profiler.section("draw.queues"):
+            self.drawn_queues = None
+            self.draw_queues()
+        with profiler.section("draw.hud"):
+            self.drawn_hud = None
+            self.draw_hud()
+        self.draw_profile(True)
+
+        with profiler.section("draw.overlay"):
+            if core.state == State.GAME_OVER:
+                self.draw_game_over_overlay()
+            elif core.state == State.PAUSED:
+                self.draw_pause_overlay()
+
+        return [self.screen.get_rect()]
+
+    def draw_changes(self):
+        """
+        Redraws only what changed since the last frame: the active and ghost
+        pieces, the queues and the HUD.  Returns the dirty regions.
+        """
+        dirty = []
+        profiler = self.profiler
+        with profiler.section("draw.pieces"):
+            for rect in self.drawn_piece_rects:
+                self.board_view.blit(self.board_surface, rect, rect)
+            piece_rects = self.draw_pieces()
+        dirty.extend(
+            rect.move(Game.BOARD_POSITION)
+            for rect in self.drawn_piece_rects + piece_rects
+        )
+        self.drawn_piece_rects = piece_rects
+
+        with profiler.section("draw.queues"):
+            dirty.extend(self.draw_queues())
+        with profiler.section("draw.hud"):
+            dirty.extend(self.draw_hud())
+        dirty.extend(self.draw_profile())
+        return dirty
+
+    def draw_profile(self, redraw=False):
+        """
+        Draws the profiler overlay if it is shown, re-rendering it every
+        PROFILE_REFRESH_FRAMES frames.  Unless redraw is set it is only
+        drawn when re-rendered.  Returns the dirty regions.
+        """
+        if not self.show_profile:
+            return []
+        with self.profiler.section("draw.profile"):
+            frames = self.profiler.frames
+            if (
+                self.profile_overlay is None
+                or frames - self.profile_overlay_frame >= Game.PROFILE_REFRESH_FRAMES
+            ):
+                self.profile_overlay = Game.render_profile_overlay(
+                    self.small_font,
+                    self.profiler,
+                    self.clock.get_fps(),
+                    self.profile_status,
+                )
+                self.profile_overlay_frame = frames
+            elif not redraw:
+                return []
+            self.screen.blit(self.profile_overlay, Game.PROFILE_RECT)
+        return [Game.PROFILE_RECT]
+
+    def viewport(self):
+        """
+        Returns the (left column, top row) of the board to show.  Boards
+        that fit are shown whole; on larger ones the view only scrolls when
+        the active piece comes within VIEW_MARGIN cells of its edge.
+        """
+        board = self.core.board
+        columns, rows = self.view_size
+        left, top = self.view
+        piece = self.core.piece
+        if piece is not None and piece.blocks:
+            xs = [block.x for block in piece.blocks]
+            ys = [block.y for block in piece.blocks]
+            margin = Game.VIEW_MARGIN
+            left = max(min(left, min(xs) - margin), max(xs) + margin - columns + 1)
+            top = min(max(top, max(ys) + margin), min(ys) - margin + rows - 1)
+        left = min(max(left, 1), board.width - columns + 1)
+        top = min(max(top, rows), board.height)
+        return left, top
+
+    def draw_blocks(self):
+        """
+        Draws the locked blocks in view onto the board surface
+        """
+        core = self.core
+        key = (core.board, core.board.version)
+        if self.block_rows_key != key:
+            self.block_rows = {}
+            for block in core.blocks:
+                self.block_rows.setdefault(block.y, []).append(block)
+            self.block_rows_key = key
+        columns, rows = self.view_size
+        left, top = self.view
+        for y in range(top - rows + 1, top + 1):
+            for block in self.block_rows.get(y, ()):
+                if left <= block.x < left + columns:
+                    block.draw(self.board_surface, view=self.view)
+
+    def draw_pieces(self):
+        """
+        Draws the ghost and active pieces onto the board.  Returns the
+        regions drawn in board coordinates.
+        """
+        rects = []
+        if self.core.ghost_piece:
+            rects.extend(self.core.ghost_piece.draw(self.board_view, view=self.view))
+        if self.core.piece:
+            # glide down through the time since the last step
+            offset_y = round(
+                self.core.fall_progress(self.accumulator) * Constants.BLOCK_HEIGHT
+            )
+            rects.extend(self.core.piece.draw(self.board_view, offset_y, self.view))
+        # blits outside the view are clipped to nothing
+        return [rect for rect in rects if rect.width and rect.height]
+
+    def draw_queues(self):
+        """
+        Draws the hold and next queues if they changed.  Returns the dirty
+        regions.
+        """
+        queues = (self.core.held_piece, self.core.piece_generator.peek())
+        if queues == self.drawn_queues:
+            return []
+        self.drawn_queues = queues
+        return [
+            Game.draw_hold_queue(self.screen, queues[0]),
+            Game.draw_next_queue(self.screen, queues[1]),
+        ]
+
+    def draw_hud(self):
+        """
+        Draws the level, score and lines if they changed.  Returns the dirty
+        regions.
+        """
+        hud = (self.core.level, self.core.score, self.core.lines)
+        if hud == self.drawn_hud:
+            return []
+        self.drawn_hud = hud
+
+        self.screen.fill(pygame.Color("black"), Game.HUD_RECT)
+        self.screen.blit(self.render_hud_text("Level", hud[0]), (10, 10))
+        self.screen.blit(self.render_hud_text("Score", hud[1]), (10, 30))
+        self.screen.blit(self.render_hud_text("Lines", hud[2]), (10, 50))
+        return [Game.HUD_RECT]
+
+    def render_hud_text(self, label, value):
+        """
+        Returns the rendered HUD line for label, only re-rendering it when
+        the value has changed
+        """
+        cached = self.hud_text.get(label)
+        if cached is None or cached[0] != value:
+            text = self.font.render(f"{label}: {value}", True, (255, 255, 255))
+            cached = (value, text)
+            self.hud_text[label] = cached
+        return cached[1]
 
     @staticmethod
     def draw_next_queue(screen, next_piece_type):
-        next_surface = pygame.Surface((160, 160))
-        pygame.draw.rect(
-            next_surface,
-            (255, 255, 255),
-            (0, 0, 160, 160),
-            1,
-        )
-
-        if next_piece_type:
-            # position is based on 20 being top of board (and viewing 4x4 cut
-            # of top left corner of board).  For centering, need to use
-            # different x offset for I and O pieces
-            if next_piece_type.NAME == "I":
-                next_piece = Piece(next_piece_type, 2, 18.5)
-            elif next_piece_type.NAME == "O":
-                next_piece = Piece(next_piece_type, 2, 18)
-            else:
-                next_piece = Piece(next_piece_type, 2.5, 18)
-
-            next_piece.draw(next_surface)
-
-        screen.blit(next_surface, (680, 100))
+        return screen.blit(Game.queue_thumbnail(next_piece_type), Game.NEXT_POSITION)
 
     @staticmethod
     def draw_hold_queue(screen, hold_piece_type):
-        hold_surface = pygame.Surface((160, 160))
+        return screen.blit(Game.queue_thumbnail(hold_piece_type), Game.HOLD_POSITION)
+
+    @staticmethod
+    def queue_thumbnail(piece_type):
+        """
+        Returns the framed preview of a piece type for the hold and next
+        queues, rendering it on first use.  None gives an empty frame.
+        """
+        key = piece_type.NAME if piece_type else None
+        thumbnail = Game.THUMBNAILS.get(key)
+        if thumbnail is not None:
+            return thumbnail
+
+        thumbnail = pygame.Surface((160, 160))
         pygame.draw.rect(
-            hold_surface,
+            thumbnail,
             (255, 255, 255),
             (0, 0, 160, 160),
             1,
         )
 
-        if hold_piece_type:
+        if piece_type:
             # position is based on 20 being top of board (and viewing 4x4 cut
             # of top left corner of board).  For centering, need to use
             # different x offset for I and O pieces
-            if hold_piece_type.NAME == "I":
-                hold_piece = Piece(hold_piece_type, 2, 18.5)
-            elif hold_piece_type.NAME == "O":
-                hold_piece = Piece(hold_piece_type, 2, 18)
+            if piece_type.NAME == "I":
+                piece = Piece(piece_type, 2, 18.5)
+            elif piece_type.NAME == "O":
+                piece = Piece(piece_type, 2, 18)
             else:
-                hold_piece = Piece(hold_piece_type, 2.5, 18)
+                piece = Piece(piece_type, 2.5, 18)
 
-            hold_piece.draw(hold_surface)
+            piece.draw(thumbnail)
 
-        screen.blit(hold_surface, (40, 600))
+        Game.THUMBNAILS[key] = thumbnail
+        return thumbnail
 
     @staticmethod
     def draw_board(board):
         board.fill((0, 0, 0))
+        width, height = board.get_size()
 
         # draw frame
-        pygame.draw.rect(
-            board,
-            (255, 255, 255),
-            (
-                0,
-                0,
-                Constants.BOARD_WIDTH * Constants.BLOCK_WIDTH,
-                Constants.SCREEN_HEIGHT,
-            ),
-            1,
-        )
+        pygame.draw.rect(board, (255, 255, 255), (0, 0, width, height), 1)
 
         # draw grid
-        for x in range(0, Constants.BOARD_WIDTH):
-            for y in range(0, Constants.BOARD_HEIGHT):
+        for x in range(0, width // Constants.BLOCK_WIDTH):
+            for y in range(0, height // Constants.BLOCK_HEIGHT):
                 pygame.draw.rect(
                     board,
                     (100, 100, 100),
@@ -405,8 +479,61 @@ class Game:
                     1,
                 )
 
+    def draw_pause_overlay(self):
+        if self.pause_overlay is None:
+            self.pause_overlay = Game.render_pause_overlay(self.big_font)
+        self.screen.blit(self.pause_overlay, (0, 0))
+
+    def draw_game_over_overlay(self):
+        if self.game_over_overlay is None:
+            self.game_over_overlay = Game.render_game_over_overlay(
+                self.big_font, self.font
+            )
+        self.screen.blit(self.game_over_overlay, (0, 0))
+
+    @staticmethod
+    def render_profile_overlay(font, profiler, fps, status=None):
+        """
+        Renders a table of the p50, p99 and max milliseconds of each
+        profiled section, with sections whose p99 is over the frame budget
+        in red, and the status line below it if given
+        """
+        overlay = pygame.Surface(Game.PROFILE_RECT.size)
+        white = (255, 255, 255)
+        overlay.blit(
+            font.render(
+                f"{fps:.1f} fps, {profiler.gc_collections} gc collections",
+                True,
+                white,
+            ),
+            (5, 5),
+        )
+        columns = ("p50", "p99", "max")
+        y = 25
+        for i, column in enumerate(columns):
+            text = font.render(column, True, white)
+            overlay.blit(text, text.get_rect(topright=(145 + 45 * i, y)))
+        # the last line is kept for the status
+        bottom = Game.PROFILE_RECT.height - (16 if status else 0)
+        for name, statistics in profiler.statistics().items():
+            y += 16
+            if y + 16 > bottom:
+                break
+            color = (
+                (255, 80, 80)
+                if statistics["p99"] > Game.FRAME_BUDGET_MS
+                else (200, 200, 200)
+            )
+            overlay.blit(font.render(name, True, color), (5, y))
+            for i, column in enumerate(columns):
+                text = font.render(f"{statistics[column]:.2f}", True, color)
+                overlay.blit(text, text.get_rect(topright=(145 + 45 * i, y)))
+        if status:
+            overlay.blit(font.render(status, True, white), (5, bottom))
+        return overlay
+
     @staticmethod
-    def draw_pause_overlay(screen, big_font):
+    def render_pause_overlay(big_font):
         pause_overlay = pygame.surface.Surface(
             (Constants.SCREEN_WIDTH, Constants.SCREEN_HEIGHT),
             flags=pygame.SRCALPHA,
@@ -419,10 +546,10 @@ class Game:
                 center=(Constants.SCREEN_WIDTH // 2, Constants.SCREEN_HEIGHT // 2)
             ),
         )
-        screen.blit(pause_overlay, (0, 0))
+        return pause_overlay
 
     @staticmethod
-    def draw_game_over_overlay(screen, big_font, small_font):
+    def render_game_over_overlay(big_font, small_font):
         game_over_overlay = pygame.surface.Surface(
             (Constants.SCREEN_WIDTH, Constants.SCREEN_HEIGHT),
             flags=pygame.SRCALPHA,
@@ -447,14 +574,91 @@ class Game:
                 )
             ),
         )
-        screen.blit(game_over_overlay, (0, 0))
-
-    @staticmethod
-    def fallspeed_from_level(level):
-        return int((0.8 - (level - 1) * 0.007) ** (level - 1) * 1000)
+        return game_over_overlay
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tetris clone in python")
+    parser.add_argument("--seed", type=int, help="seed for the piece sequence")
+    parser.add_argument("--record", metavar="FILE", help="record a replay to FILE")
+    parser.add_argument("--bot", action="store_true", help="let the bot play")
+    parser.add_argument(
+        "--beam-width", type=int, default=8, help="boards the bot keeps per depth"
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        default=50,
+        metavar="MS",
+        help="bot search time per piece",
+    )
+    parser.add_argument(
+        "--profile", action="store_true", help="show the frame time overlay (F3)"
+    )
+    parser.add_argument(
+        "--profile-output",
+        default="profile.json",
+        metavar="FILE",
+        help="file F4 writes the frame time profile to",
+    )
+    parser.add_argument(
+        "--fps", type=int, default=240, help="frame rate cap, 0 for none"
+    )
+    parser.add_argument(
+        "--width",
+        type=int,
+        default=Constants.BOARD_WIDTH,
+        help=f"board columns, up to {Constants.MAX_BOARD_WIDTH}",
+    )
+    parser.add_argument(
+        "--height",
+        type=int,
+        default=Constants.BOARD_HEIGHT,
+        help=f"board rows, up to {Constants.MAX_BOARD_HEIGHT}",
+    )
+    parser.add_argument(
+        "--das",
+        type=int,
+        default=Constants.DAS_MS,
+        metavar="MS",
+        help="delay before a held direction repeats",
+    )
+    parser.add_argument(
+        "--arr",
+        type=int,
+        default=Constants.ARR_MS,
+        metavar="MS",
+        help="time between repeats, 0 to slide to the wall",
+    )
+    parser.add_argument(
+        "--soft-drop-factor",
+        type=int,
+        default=Constants.SOFT_DROP_FACTOR,
+        help="how many times faster than gravity soft drop is",
+    )
+    args = parser.parse_args()
+    if args.das < 0:
+        parser.error("--das must not be negative")
+    if args.arr < 0:
+        parser.error("--arr must not be negative")
+    if args.soft_drop_factor < 1:
+        parser.error("--soft-drop-factor must be at least 1")
+    if not 4 <= args.width <= Constants.MAX_BOARD_WIDTH:
+        parser.error(f"--width must be from 4 to {Constants.MAX_BOARD_WIDTH}")
+    if not 4 <= args.height <= Constants.MAX_BOARD_HEIGHT:
+        parser.error(f"--height must be from 4 to {Constants.MAX_BOARD_HEIGHT}")
+
     pygame.init()
-    game = Game()
+    bot = Bot(args.beam_width, args.time_budget) if args.bot else None
+    game = Game(
+        seed=args.seed,
+        record_path=args.record,
+        bot=bot,
+        show_profile=args.profile,
+        profile_path=args.profile_output,
+        fps=args.fps,
+        auto_shift=AutoShift(args.das, args.arr, args.soft_drop_factor),
+        width=args.width,
+        height=args.height,
+    )
     game.run()
@@ -1,9 +1,10 @@
-import pygame
 from block import Block
 from piece_type import PieceType, Orientation
+from zobrist import Zobrist
 
 
 class Piece:
+    # spawn position on the standard board, see spawn_position()
     START_X = 5
     START_Y = 21
 
@@ -23,70 +24,113 @@ class Piece:
         self.y = y
         self.type = type
         self.style = style
-        self.blocks = pygame.sprite.Group()
         self.orientation = orientation
-        pattern = type.mask(self.orientation)
-        self.blocks.add(
-            *[
-                Block(x + (self.x - 1), -y + (self.y + 1), type.color(), style)
-                for y, row in enumerate(pattern)
-                for x, value in enumerate(row)
-                if value
-            ]
-        )
-
-    def can_fall(self, blocks):
-        return all(block.can_fall(blocks) for block in self.blocks)
-
-    def fall(self, blocks):
-        if self.can_fall(blocks):
+        self.shape = type.shapes[orientation]
+        self.hash = Zobrist.piece(type, x, y, orientation)
+        self.blocks = [
+            Block(self.x + dx, self.y + dy, type.color(), style)
+            for dx, dy in self.shape.cells
+        ]
+
+    @staticmethod
+    def spawn_position(board):
+        """
+        Returns the (x, y) pieces spawn at on board: the middle column, just
+        above the top row
+        """
+        return board.width // 2, board.height + 1
+
+    def can_fall(self, board):
+        return board.can_place(self.shape, self.x, self.y - 1)
+
+    def fall(self, board):
+        if self.can_fall(board):
             [block.fall() for block in self.blocks]
+            self.hash ^= Zobrist.key("y", self.y) ^ Zobrist.key("y", self.y - 1)
             self.y -= 1
             return True
         else:
             return False
 
-    def move_right(self, blocks):
-        if all(block.can_move_right(blocks) for block in self.blocks):
+    def drop(self, board):
+        """
+        Drops the piece straight down to where it lands
+        """
+        y = board.drop_y(self.shape, self.x, self.y)
+        if y != self.y:
+            self.hash ^= Zobrist.key("y", self.y) ^ Zobrist.key("y", y)
+            self.y = y
+            self.__place_blocks()
+
+    def move_to(self, x, y, orientation):
+        """
+        Moves the piece to the given position and orientation without any
+        collision checks
+        """
+        self.x = x
+        self.y = y
+        self.orientation = orientation
+        self.shape = self.type.shapes[orientation]
+        self.hash = Zobrist.piece(self.type, x, y, orientation)
+        self.__place_blocks()
+
+    def move_right(self, board):
+        if board.can_place(self.shape, self.x + 1, self.y):
             [block.move_right() for block in self.blocks]
+            self.hash ^= Zobrist.key("x", self.x) ^ Zobrist.key("x", self.x + 1)
             self.x += 1
 
-    def move_left(self, blocks):
-        if all(block.can_move_left(blocks) for block in self.blocks):
+    def move_left(self, board):
+        if board.can_place(self.shape, self.x - 1, self.y):
             [block.move_left() for block in self.blocks]
+            self.hash ^= Zobrist.key("x", self.x) ^ Zobrist.key("x", self.x - 1)
             self.x -= 1
 
-    def is_blocked(self, blocks):
-        return not all(block.not_collided(blocks) for block in self.blocks)
+    def shift(self, board, columns):
+        """
+        Moves the piece up to columns columns, to the right if positive and
+        to the left if negative, stopping where it would collide
+        """
+        if not columns:
+            return
+        step = 1 if columns > 0 else -1
+        x = self.x
+        while x != self.x + columns and board.can_place(self.shape, x + step, self.y):
+            x += step
+        if x != self.x:
+            self.move_to(x, self.y, self.orientation)
+
+    def is_blocked(self, board):
+        return not board.can_place(self.shape, self.x, self.y)
 
-    def rotate_cw(self, blocks):
-        new_orientation = Orientation.rotate_cw(self.orientation)
-        offsets = self.type.CW_ROTATION_OFFSETS[self.orientation]
+    def rotate_cw(self, board):
+        new_orientation, offsets = self.type.cw_kicks[self.orientation]
+        new_shape = self.type.shapes[new_orientation]
 
         for offset in offsets:
-            new_blocks = self.__generate_rotated_blocks(
-                offset, self.type.mask(new_orientation)
-            )
-            if all(block.not_collided(blocks) for block in new_blocks):
-                self.blocks.empty()
-                self.blocks.add(*new_blocks)
+            if board.can_place(new_shape, self.x + offset[0], self.y + offset[1]):
+                self.hash ^= Zobrist.piece(
+                    self.type, self.x, self.y, self.orientation
+                ) ^ Zobrist.piece(
+                    self.type,
+                    self.x + offset[0],
+                    self.y + offset[1],
+                    new_orientation,
+                )
                 self.orientation = new_orientation
+                self.shape = new_shape
                 self.x += offset[0]
                 self.y += offset[1]
+                self.__place_blocks()
                 return
 
-    def __generate_rotated_blocks(self, offset, mask):
-        return [
-            Block(
-                x + (self.x - 1) + offset[0],
-                -y + (self.y + 1) + offset[1],
-                self.type.color(),
-                self.style,
-            )
-            for y, row in enumerate(mask)
-            for x, value in enumerate(row)
-            if value
-        ]
+    def __place_blocks(self):
+        """
+        Moves the existing blocks onto the cells of the current shape
+        """
+        for block, (dx, dy) in zip(self.blocks, self.shape.cells):
+            block.x = self.x + dx
+            block.y = self.y + dy
 
-    def draw(self, screen):
-        [block.draw(screen) for block in self.blocks]
+    def draw(self, screen, offset_y=0, view=Block.VIEW):
+        return [block.draw(screen, offset_y, view) for block in self.blocks]
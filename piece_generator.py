@@ -8,21 +8,51 @@ import random
 class PieceGenerator:
     PIECES = [OPiece(), TPiece(), IPiece(), LPiece(), JPiece(), SPiece(), ZPiece()]
 
-    def __init__(self):
+    def __init__(self, seed=None):
+        """
+        Each bag is shuffled with a generator seeded from the seed and the
+        number of bags dealt so far, so the piece sequence is determined by
+        the seed alone and the generator state is just (seed, bags, bag)
+        """
+        self.seed = seed if seed is not None else random.getrandbits(32)
+        self.bags = 0
         self.bag = []
         self.shuffle()
 
     def shuffle(self):
+        self.bag.extend(PieceGenerator.shuffled(self.seed, self.bags))
+        self.bags += 1
+
+    @staticmethod
+    def shuffled(seed, bags):
+        """
+        Returns the bag dealt after the given number of bags, in reverse
+        order of dealing
+        """
         new_bag = PieceGenerator.PIECES.copy()
-        random.shuffle(new_bag)
-        self.bag.extend(new_bag)
+        random.Random(seed << 32 | bags).shuffle(new_bag)
+        return new_bag
 
-    def next(self):
+    def next(self, x=Piece.START_X, y=Piece.START_Y):
         if not self.bag:
             self.shuffle()
-        return Piece(self.bag.pop())
+        return Piece(self.bag.pop(), x, y)
 
     def peek(self):
         if not self.bag:
             self.shuffle()
         return self.bag[-1]
+
+    def preview(self, count):
+        """
+        Returns the types of the next count pieces without dealing them.
+        Bags are determined by the seed, so pieces beyond the current bag
+        are known too.
+        """
+        types = list(reversed(self.bag[-count:] if count else []))
+        bags = self.bags
+        while len(types) < count:
+            new_bag = PieceGenerator.shuffled(self.seed, bags)
+            bags += 1
+            types.extend(reversed(new_bag[len(types) - count :]))
+        return types
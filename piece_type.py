@@ -21,7 +21,53 @@ class Orientation(Enum):
                 return Orientation.NORTH
 
 
+class Shape:
+    """
+    Compiled form of a piece in a single orientation.  Cells are (dx, dy)
+    offsets from the piece position, and row masks are (dy, mask) pairs
+    where bit 0 of mask is the leftmost column of the shape.
+    """
+
+    def __init__(self, mask):
+        self.cells = tuple(
+            (x - 1, 1 - y)
+            for y, row in enumerate(mask)
+            for x, value in enumerate(row)
+            if value
+        )
+        self.left = min(dx for dx, _ in self.cells)
+        self.right = max(dx for dx, _ in self.cells)
+        self.bottom = min(dy for _, dy in self.cells)
+        self.top = max(dy for _, dy in self.cells)
+
+        # lowest cell of each column as (dx, dy) pairs
+        bottom_profile = {}
+        for dx, dy in self.cells:
+            bottom_profile[dx] = min(dy, bottom_profile.get(dx, dy))
+        self.bottom_profile = tuple(sorted(bottom_profile.items()))
+
+        row_masks = {}
+        for dx, dy in self.cells:
+            row_masks[dy] = row_masks.get(dy, 0) | 1 << (dx - self.left)
+        self.row_masks = tuple(sorted(row_masks.items()))
+
+
 class PieceType(ABC):
+    def __init__(self):
+        """
+        Compiles the shape and kick tables for every orientation so that
+        spawning and rotation are table lookups
+        """
+        self.shapes = {
+            orientation: Shape(self.mask(orientation)) for orientation in Orientation
+        }
+        self.cw_kicks = {
+            orientation: (
+                Orientation.rotate_cw(orientation),
+                tuple(self.CW_ROTATION_OFFSETS[orientation]),
+            )
+            for orientation in Orientation
+        }
 
     @property
     @abstractmethod
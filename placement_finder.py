@@ -0,0 +1,231 @@
+from collections import deque
+from enum import Enum
+from piece import Piece
+from piece_type import Orientation
+from transposition_table import TranspositionTable
+from zobrist import Zobrist
+
+
+import time
+
+
+class Move(Enum):
+    LEFT = 1
+    RIGHT = 2
+    ROTATE_CW = 3
+    DROP = 4
+
+
+class Placement:
+    def __init__(self, piece_type, x, y, orientation, path):
+        """
+        Final resting position of a piece and the shortest sequence of moves
+        that reaches it from the start position
+        """
+        self.type = piece_type
+        self.x = x
+        self.y = y
+        self.orientation = orientation
+        self.path = path
+
+    def cells(self):
+        return [
+            (self.x + dx, self.y + dy)
+            for dx, dy in self.type.shapes[self.orientation].cells
+        ]
+
+
+class PlacementFinder:
+    """
+    Enumerates every resting placement a piece can reach from its start
+    position with left, right, clockwise rotation (including kicks) and
+    single-row drops.  Searches are breadth first so each placement carries
+    a shortest path, and results are kept in a transposition table keyed on
+    the Zobrist hash of the board and the starting piece.
+    """
+
+    ORIENTATIONS = list(Orientation)
+    # rows above the stack from which a piece can neither touch it nor be
+    # kicked onto it: cells reach 2 rows below a piece and kicks 2 more
+    CLEARANCE = 5
+    # states searched between checks of the deadline
+    DEADLINE_INTERVAL = 256
+
+    def __init__(self, max_cache_size=4096):
+        self.cache = TranspositionTable(max_cache_size)
+
+    def find(
+        self,
+        board,
+        piece_type,
+        x=None,
+        y=None,
+        orientation=Orientation.NORTH,
+        deadline=None,
+    ):
+        """
+        Returns the reachable placements of piece_type on board, starting
+        from (x, y, orientation), which defaults to where a piece is after
+        spawning.  Placements covering the same cells are reported once.
+        If deadline, a time.perf_counter() value, passes before the search
+        is done, returns None.
+        """
+        x, y = PlacementFinder.start(board, x, y)
+        key = (
+            board.hash
+            ^ Zobrist.size(board)
+            ^ Zobrist.piece(piece_type, x, y, orientation)
+        )
+        placements = self.cache.get(key)
+        if placements is None:
+            placements = self.__search(board, piece_type, x, y, orientation, deadline)
+            if placements is not None:
+                self.cache.put(key, placements)
+        return placements
+
+    @staticmethod
+    def start(board, x=None, y=None):
+        """
+        Returns (x, y), with either left as None replaced by where a piece
+        is on board after spawning and falling one row
+        """
+        spawn_x, spawn_y = Piece.spawn_position(board)
+        return (
+            spawn_x if x is None else x,
+            spawn_y - 1 if y is None else y,
+        )
+
+    @staticmethod
+    def drops(
+        board,
+        piece_type,
+        x=None,
+        y=None,
+        orientation=Orientation.NORTH,
+    ):
+        """
+        Yields the placements reachable by rotating and then shifting the
+        piece from (x, y, orientation) and hard dropping it.  This is much
+        cheaper than find() and is used by searches that look many pieces
+        ahead, at the cost of missing placements that need tucks or spins.
+        """
+        x, y = PlacementFinder.start(board, x, y)
+        seen = set()
+        rotations = []
+        for _ in range(4):
+            shape = piece_type.shapes[orientation]
+            for step, move in ((-1, Move.LEFT), (1, Move.RIGHT)):
+                shift = x if step < 0 else x + 1
+                while board.can_place(shape, shift, y):
+                    landing = board.drop_y(shape, shift, y)
+                    cells = tuple((shift + dx, landing + dy) for dx, dy in shape.cells)
+                    if cells not in seen:
+                        seen.add(cells)
+                        path = rotations + [move] * abs(shift - x)
+                        path += [Move.DROP] * (y - landing)
+                        yield Placement(piece_type, shift, landing, orientation, path)
+                    shift += step
+            new_orientation, kicks = piece_type.cw_kicks[orientation]
+            new_shape = piece_type.shapes[new_orientation]
+            for dx, dy in kicks:
+                if board.can_place(new_shape, x + dx, y + dy):
+                    x, y, orientation = x + dx, y + dy, new_orientation
+                    rotations = rotations + [Move.ROTATE_CW]
+                    break
+            else:
+                return
+
+    def __search(self, board, piece_type, x, y, orientation, deadline):
+        if not board.can_place(piece_type.shapes[orientation], x, y):
+            return []
+
+        # the board is empty above the stack, so a piece starting high above
+        # it reaches the same placements as one dropped to just above it,
+        # which keeps the search from growing with the board height
+        fall = max(y - max(board.heights) - PlacementFinder.CLEARANCE, 0)
+        y -= fall
+        prefix = [Move.DROP] * fall
+
+        # states are packed into ints as ((y * stride) + x) * 4 + orientation
+        # so the visited set stays compact; x and y are offset to stay positive
+        stride = board.width + 2
+        offset = 4
+
+        def pack(x, y, o):
+            return (((y + offset) * stride) + x + 1) * 4 + o
+
+        start_o = self.ORIENTATIONS.index(orientation)
+        start = pack(x, y, start_o)
+        parents = {start: None}
+        queue = deque([(x, y, start_o, start)])
+        resting = {}
+
+        searched = 0
+        while queue:
+            searched += 1
+            if (
+                deadline is not None
+                and searched % PlacementFinder.DEADLINE_INTERVAL == 0
+                and time.perf_counter() >= deadline
+            ):
+                return None
+            x, y, o, state = queue.popleft()
+            orientation = self.ORIENTATIONS[o]
+            shape = piece_type.shapes[orientation]
+
+            if board.can_place(shape, x - 1, y):
+                self.__visit(parents, queue, state, Move.LEFT, x - 1, y, o, pack)
+            if board.can_place(shape, x + 1, y):
+                self.__visit(parents, queue, state, Move.RIGHT, x + 1, y, o, pack)
+
+            new_orientation, kicks = piece_type.cw_kicks[orientation]
+            new_shape = piece_type.shapes[new_orientation]
+            for dx, dy in kicks:
+                if board.can_place(new_shape, x + dx, y + dy):
+                    self.__visit(
+                        parents,
+                        queue,
+                        state,
+                        Move.ROTATE_CW,
+                        x + dx,
+                        y + dy,
+                        (o + 1) % 4,
+                        pack,
+                    )
+                    break
+
+            # drops are tried last so that among equally short paths the
+            # ones that move and rotate first are found, which can be played
+            # with a hard drop
+            if not board.can_place(shape, x, y - 1):
+                cells = tuple(
+                    (y + dy, mask << (x + shape.left - 1))
+                    for dy, mask in shape.row_masks
+                )
+                if cells not in resting:
+                    resting[cells] = (x, y, orientation, state)
+            else:
+                self.__visit(parents, queue, state, Move.DROP, x, y - 1, o, pack)
+
+        return [
+            Placement(
+                piece_type, x, y, orientation, prefix + self.__path(parents, state)
+            )
+            for x, y, orientation, state in resting.values()
+        ]
+
+    @staticmethod
+    def __visit(parents, queue, parent, move, x, y, o, pack):
+        state = pack(x, y, o)
+        if state not in parents:
+            parents[state] = (parent, move)
+            queue.append((x, y, o, state))
+
+    @staticmethod
+    def __path(parents, state):
+        path = []
+        while parents[state] is not None:
+            state, move = parents[state]
+            path.append(move)
+        path.reverse()
+        return path
@@ -0,0 +1,153 @@
+import gc
+import json
+import time
+
+
+class RingBuffer:
+    """
+    Fixed-size buffer of the most recent samples
+    """
+
+    def __init__(self, size):
+        self.samples = [0] * size
+        self.index = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, sample):
+        self.samples[self.index] = sample
+        self.index = (self.index + 1) % len(self.samples)
+        self.count = min(self.count + 1, len(self.samples))
+
+    def values(self):
+        """
+        Returns the samples in the order they were added
+        """
+        if self.count < len(self.samples):
+            return self.samples[: self.count]
+        return self.samples[self.index :] + self.samples[: self.index]
+
+
+class Section:
+    """
+    Context manager that adds the time spent inside it to the current frame
+    of its profiler.  Sections are reused, so timing one allocates nothing.
+    """
+
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+
+    def __exit__(self, *exc):
+        frame = self.profiler.frame
+        frame[self.name] = frame.get(self.name, 0) + time.perf_counter_ns() - self.start
+
+
+class Profiler:
+    """
+    Frame time instrumentation.  Named sections are timed with
+    section(name), and between begin_frame() and end_frame() the time of
+    every section is summed, so a section entered several times in a frame
+    is recorded once.  The last size frames of each section, of the whole
+    frame and of garbage collection pauses are kept in ring buffers, from
+    which percentiles are computed on demand.  Sections may nest, and a
+    collection pause also counts towards the sections it interrupted.
+    """
+
+    FRAME = "frame"
+    GC = "gc"
+    PERCENTILES = (50, 99)
+
+    def __init__(self, size=600):
+        self.size = size
+        self.buffers = {}
+        self.sections = {}
+        self.frame = {}
+        self.frame_start = 0
+        self.frames = 0
+        self.gc_collections = 0
+        self.gc_start = 0
+        gc.callbacks.append(self.__collected)
+
+    def close(self):
+        if self.__collected in gc.callbacks:
+            gc.callbacks.remove(self.__collected)
+
+    def section(self, name):
+        section = self.sections.get(name)
+        if section is None:
+            section = Section(self, name)
+            self.sections[name] = section
+        return section
+
+    def begin_frame(self):
+        self.frame = {}
+        self.frame_start = time.perf_counter_ns()
+
+    def end_frame(self):
+        self.frame[Profiler.FRAME] = time.perf_counter_ns() - self.frame_start
+        # copied first, as a collection starting here would add to the frame
+        for name, ns in list(self.frame.items()):
+            buffer = self.buffers.get(name)
+            if buffer is None:
+                buffer = RingBuffer(self.size)
+                self.buffers[name] = buffer
+            buffer.append(ns)
+        self.frames += 1
+
+    def __collected(self, phase, info):
+        """
+        gc callback timing each collection, whose pause is added to the
+        current frame like a section
+        """
+        if phase == "start":
+            self.gc_start = time.perf_counter_ns()
+        elif self.gc_start:
+            self.gc_collections += 1
+            pause = time.perf_counter_ns() - self.gc_start
+            self.frame[Profiler.GC] = self.frame.get(Profiler.GC, 0) + pause
+            self.gc_start = 0
+
+    def statistics(self):
+        """
+        Returns {section: {"frames", "p50", "p99", "max"}} with times in
+        milliseconds over the buffered frames, the whole frame first
+        """
+        statistics = {}
+        names = sorted(self.buffers, key=lambda name: name != Profiler.FRAME)
+        for name in names:
+            values = sorted(self.buffers[name].values())
+            statistics[name] = {"frames": len(values)}
+            for percentile in Profiler.PERCENTILES:
+                index = min(len(values) - 1, len(values) * percentile // 100)
+                statistics[name][f"p{percentile}"] = values[index] / 1e6
+            statistics[name]["max"] = values[-1] / 1e6
+        return statistics
+
+    def dump(self, path):
+        """
+        Writes the statistics and the buffered samples, in milliseconds, to
+        path as JSON
+        """
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "frames": self.frames,
+                    "gc_collections": self.gc_collections,
+                    "statistics": self.statistics(),
+                    "samples": {
+                        name: [ns / 1e6 for ns in buffer.values()]
+                        for name, buffer in self.buffers.items()
+                    },
+                },
+                f,
+                indent=2,
+            )
@@ -0,0 +1,235 @@
+from game_core import GameCore, Action
+from game_state import GameState
+from varint import Varint
+
+
+from bisect import bisect_right
+from itertools import islice
+import argparse
+import sys
+
+
+class ReplayRecorder:
+    """
+    Records the seed of a GameCore and every step's inputs and elapsed ticks,
+    plus a keyframe snapshot of the game every keyframe_interval steps.
+
+    The binary format is the MAGIC bytes followed by varints: the seed,
+    zigzag encoded as seeds may be negative, the final score, lines and level, the number of steps and the length of the
+    step records, then the records themselves.  A record is the step's dt
+    and its number of inputs followed by one varint per input,
+    (action value << 1) | pressed.  A record with no inputs is followed by a
+    repeat count instead, so runs of idle steps with the same dt take three
+    bytes.  After the records comes the keyframe count and, for each
+    keyframe, the step it was taken before, the offset of that step's
+    record, and the length and bytes of its GameState.
+    """
+
+    def __init__(self, core, keyframe_interval=600):
+        """
+        record must be called with the inputs and dt of every step, before
+        they are passed to core.step
+        """
+        self.core = core
+        self.seed = core.seed
+        self.keyframe_interval = keyframe_interval
+        self.records = bytearray()
+        self.keyframes = []
+        self.steps = 0
+        self.idle_dt = None
+        self.idle_count = 0
+
+    def record(self, inputs, dt):
+        if self.steps % self.keyframe_interval == 0:
+            # keyframes always start a new record so they can be seeked to
+            self.__flush_idle()
+            self.keyframes.append(
+                (self.steps, len(self.records), self.core.snapshot().to_bytes())
+            )
+        self.steps += 1
+
+        if not inputs:
+            if dt != self.idle_dt:
+                self.__flush_idle()
+                self.idle_dt = dt
+            self.idle_count += 1
+            return
+
+        self.__flush_idle()
+        Varint.write(self.records, dt)
+        Varint.write(self.records, len(inputs))
+        for action, pressed in inputs:
+            Varint.write(self.records, action.value << 1 | bool(pressed))
+
+    def to_bytes(self):
+        """
+        Returns the recording, including the final score, lines and level of
+        the core for verifying playback
+        """
+        self.__flush_idle()
+        data = bytearray(Replay.MAGIC)
+        Varint.write_signed(data, self.seed)
+        for value in (
+            self.core.score,
+            self.core.lines,
+            self.core.level,
+            self.steps,
+            len(self.records),
+        ):
+            Varint.write(data, value)
+        data += self.records
+
+        Varint.write(data, len(self.keyframes))
+        for step, offset, state in self.keyframes:
+            Varint.write(data, step)
+            Varint.write(data, offset)
+            Varint.write(data, len(state))
+            data += state
+        return bytes(data)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    def __flush_idle(self):
+        if self.idle_count:
+            Varint.write(self.records, self.idle_dt)
+            Varint.write(self.records, 0)
+            Varint.write(self.records, self.idle_count)
+        self.idle_dt = None
+        self.idle_count = 0
+
+
+class Replay:
+    MAGIC = b"PTR3"
+    ACTIONS = {action.value: action for action in Action}
+
+    def __init__(self, data):
+        if data[: len(Replay.MAGIC)] != Replay.MAGIC:
+            raise ValueError("Not a replay file")
+        self.data = data
+        pos = len(Replay.MAGIC)
+        self.seed, pos = Varint.read_signed(data, pos)
+        self.score, pos = Varint.read(data, pos)
+        self.lines, pos = Varint.read(data, pos)
+        self.level, pos = Varint.read(data, pos)
+        self.step_count, pos = Varint.read(data, pos)
+        records_length, pos = Varint.read(data, pos)
+        self.records_start = pos
+        self.records_end = pos + records_length
+
+        # seek index of (step, record position, state position), the states
+        # themselves are only decoded when seeking
+        pos = self.records_end
+        count, pos = Varint.read(data, pos)
+        self.keyframes = []
+        for _ in range(count):
+            step, pos = Varint.read(data, pos)
+            offset, pos = Varint.read(data, pos)
+            length, pos = Varint.read(data, pos)
+            self.keyframes.append((step, self.records_start + offset, pos))
+            pos += length
+        self.keyframe_steps = [step for step, _, _ in self.keyframes]
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            return Replay(f.read())
+
+    def steps(self, pos=None):
+        """
+        Yields the (inputs, dt) of every recorded step, starting from the
+        record at pos or the beginning
+        """
+        data = self.data
+        pos = self.records_start if pos is None else pos
+        while pos < self.records_end:
+            dt, pos = Varint.read(data, pos)
+            count, pos = Varint.read(data, pos)
+            if count == 0:
+                repeat, pos = Varint.read(data, pos)
+                for _ in range(repeat):
+                    yield (), dt
+                continue
+            inputs = []
+            for _ in range(count):
+                code, pos = Varint.read(data, pos)
+                inputs.append((Replay.ACTIONS[code >> 1], bool(code & 1)))
+            yield inputs, dt
+
+    def play(self):
+        """
+        Feeds the recording through a headless GameCore as fast as possible
+        and returns the core in its final state
+        """
+        # the first keyframe carries the handling settings the game was played with
+        core = self.seek(0)
+        for inputs, dt in self.steps():
+            core.step(inputs, dt)
+        return core
+
+    def seek(self, step):
+        """
+        Returns a headless GameCore in the state it was in after the given
+        number of steps, restored from the nearest keyframe at or before it
+        and re-simulated from there
+        """
+        core = GameCore(self.seed)
+        start, pos = 0, None
+        i = bisect_right(self.keyframe_steps, step) - 1
+        if i >= 0:
+            start, pos, state_pos = self.keyframes[i]
+            core.restore(GameState.from_bytes(self.data, state_pos)[0])
+
+        for inputs, dt in islice(self.steps(pos), step - start):
+            core.step(inputs, dt)
+        return core
+
+    def matches(self, core):
+        """
+        Returns true if core finished with the recorded score, lines and level
+        """
+        return (core.score, core.lines, core.level) == (
+            self.score,
+            self.lines,
+            self.level,
+        )
+
+    def verify(self):
+        """
+        Returns true if playback reproduces the recorded final result
+        """
+        return self.matches(self.play())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Play back replays headlessly and check their results"
+    )
+    parser.add_argument("replays", nargs="+")
+    parser.add_argument(
+        "--seek",
+        type=int,
+        metavar="STEP",
+        help="show the state after STEP steps instead of checking the result",
+    )
+    args = parser.parse_args()
+
+    failed = 0
+    for path in args.replays:
+        replay = Replay.load(path)
+        if args.seek is not None:
+            core = replay.seek(args.seek)
+            print(
+                f"{path} step {args.seek}: {core.state.name} {core.phase.name}"
+                f" score {core.score} lines {core.lines} level {core.level}"
+            )
+            continue
+        core = replay.play()
+        ok = replay.matches(core)
+        failed += not ok
+        print(
+            f"{path}: score {core.score} lines {core.lines} level {core.level}"
+            f" {'ok' if ok else 'MISMATCH'}"
+        )
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,339 @@
+from board import Board
+from collections import deque
+from enum import Enum
+from piece import Piece
+from piece_generator import PieceGenerator
+from piece_type import Orientation
+from placement_finder import PlacementFinder
+from transposition_table import TranspositionTable
+from zobrist import Zobrist
+
+
+import argparse
+import time
+
+
+class Press(Enum):
+    """
+    A single key press.  DAS presses hold the key until the piece stops at
+    a wall or stack, and SOFT_DROP holds soft drop until it lands.
+    """
+
+    LEFT = 1
+    RIGHT = 2
+    ROTATE_CW = 3
+    DAS_LEFT = 4
+    DAS_RIGHT = 5
+    SOFT_DROP = 6
+    HARD_DROP = 7
+
+
+class Solver:
+    """
+    Answers training mode hints: whether the upcoming pieces can clear the
+    board completely, and the fewest key presses (finesse) that play a
+    piece into a given placement.
+
+    Perfect clears are searched depth first over hard drop placements that
+    stay below a ceiling, pruning boards whose empty cells under the
+    ceiling cannot be filled by whole pieces.  Every subproblem, keyed on
+    (board, remaining pieces, hold, ceiling), is stored in a transposition
+    table shared by all solvers, so repeated and overlapping queries are
+    answered from the cache.  Searches stop after time_limit_ms, in which
+    case the answer is None and timed_out is set; unfinished subproblems
+    are not cached, but finished ones are, so asking again on the next
+    frame carries on where the last search stopped.
+    """
+
+    CACHE = TranspositionTable(1 << 16)
+    MAX_HEIGHT = 4
+
+    def __init__(self, time_limit_ms=10, cache=None):
+        self.time_limit_ms = time_limit_ms
+        self.cache = cache if cache is not None else Solver.CACHE
+        self.deadline = 0
+        self.timed_out = False
+        self.nodes = 0
+
+    def perfect_clear(
+        self, board, pieces, held=None, can_hold=True, max_height=MAX_HEIGHT
+    ):
+        """
+        Searches for a way to play pieces, the piece types starting with the
+        current one, that leaves board empty.  Returns a list of (placement,
+        hold) pairs, where hold is true if the piece is held first and the
+        placement is of the piece played instead, or None if there is no
+        perfect clear within max_height rows or the time ran out.
+        """
+        self.__start()
+        pieces = tuple(pieces)
+        top = max(board.heights)
+        for height in range(max(top, 1), max_height + 1):
+            solution = self.__search(board, pieces, held, can_hold, height)
+            if solution is not None:
+                return list(solution)
+            if self.timed_out:
+                return None
+        return None
+
+    def __search(self, board, pieces, held, can_hold, height):
+        if not any(board.heights):
+            return ()
+        if time.perf_counter() >= self.deadline:
+            self.timed_out = True
+            return None
+        self.nodes += 1
+
+        key = (
+            board.hash ^ Zobrist.size(board),
+            tuple(piece_type.NAME for piece_type in pieces),
+            held.NAME if held else None,
+            can_hold,
+            height,
+        )
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached or None
+
+        solution = None
+        x, spawn_y = Piece.spawn_position(board)
+        if Solver.fillable(board, height, len(pieces) + (held is not None)):
+            for piece_type, rest, next_held, hold in Solver.__options(
+                pieces, held, can_hold
+            ):
+                y = spawn_y if hold else spawn_y - 1
+                for placement in PlacementFinder.drops(board, piece_type, x, y):
+                    cells = placement.cells()
+                    if max(y for _, y in cells) > height:
+                        continue
+                    child = board.copy()
+                    child.lock(cells)
+                    lines = child.full_rows()
+                    child.eliminate(lines)
+                    result = self.__search(
+                        child, rest, next_held, True, height - len(lines)
+                    )
+                    if result is not None:
+                        solution = ((placement, hold),) + result
+                        break
+                    if self.timed_out:
+                        return None
+                if solution is not None:
+                    break
+        self.cache.put(key, solution or False)
+        return solution
+
+    @staticmethod
+    def __options(pieces, held, can_hold):
+        """
+        Yields (piece type, remaining pieces, held piece, hold) for playing
+        the current piece and, if allowed, for holding it first
+        """
+        if not pieces:
+            return
+        current = pieces[0]
+        yield current, pieces[1:], held, False
+        if not can_hold:
+            return
+        if held is None:
+            if len(pieces) > 1 and pieces[1] is not current:
+                yield pieces[1], pieces[2:], current, True
+        elif held is not current:
+            yield held, pieces[1:], current, True
+
+    @staticmethod
+    def fillable(board, height, pieces):
+        """
+        Returns true if the empty cells in the bottom height rows could be
+        filled exactly by at most pieces pieces.  Every region of connected
+        empty cells must be a multiple of four cells, since pieces may not
+        cross the ceiling.
+        """
+        if max(board.heights) > height:
+            return False
+        empty = [board.full_row & ~board.row(y) for y in range(1, height + 1)]
+        cells = sum(row.bit_count() for row in empty)
+        if cells % 4 or cells // 4 > pieces:
+            return False
+        for start in range(height):
+            while empty[start]:
+                # flood fill the region of the lowest remaining empty cell
+                region = [0] * height
+                region[start] = empty[start] & -empty[start]
+                grown = True
+                while grown:
+                    grown = False
+                    for y in range(start, height):
+                        mask = region[y]
+                        mask |= mask << 1 | mask >> 1
+                        if y > start:
+                            mask |= region[y - 1]
+                        if y < height - 1:
+                            mask |= region[y + 1]
+                        mask &= empty[y]
+                        if mask != region[y]:
+                            region[y] = mask
+                            grown = True
+                if sum(row.bit_count() for row in region) % 4:
+                    return False
+                for y in range(start, height):
+                    empty[y] &= ~region[y]
+        return True
+
+    def finesse(
+        self,
+        board,
+        piece_type,
+        target,
+        x=None,
+        y=None,
+        orientation=Orientation.NORTH,
+    ):
+        """
+        Returns the shortest list of Presses that moves piece_type from (x,
+        y, orientation) into the target cells and locks it there, or None
+        if they cannot be reached.  target is a Placement or (x, y) cells.
+        Gravity is ignored, as it is too slow to matter before the piece
+        reaches the stack.
+        """
+        x, y = PlacementFinder.start(board, x, y)
+        target = frozenset(target.cells() if hasattr(target, "cells") else target)
+        key = (
+            "finesse",
+            board.hash
+            ^ Zobrist.size(board)
+            ^ Zobrist.piece(piece_type, x, y, orientation),
+            target,
+        )
+        cached = self.cache.get(key)
+        if cached is not None:
+            return list(cached) if cached is not False else None
+        route = Solver.__route(board, piece_type, target, x, y, orientation)
+        self.cache.put(key, tuple(route) if route is not None else False)
+        return route
+
+    @staticmethod
+    def __route(board, piece_type, target, x, y, orientation):
+        if not board.can_place(piece_type.shapes[orientation], x, y):
+            return None
+        start = (x, y, orientation)
+        parents = {start: None}
+        queue = deque([start])
+        while queue:
+            state = queue.popleft()
+            x, y, orientation = state
+            shape = piece_type.shapes[orientation]
+            landing = board.drop_y(shape, x, y)
+            cells = {(x + dx, landing + dy) for dx, dy in shape.cells}
+            if cells == target:
+                route = [Press.HARD_DROP]
+                while parents[state] is not None:
+                    state, press = parents[state]
+                    route.append(press)
+                route.reverse()
+                return route
+
+            moves = []
+            for step, press, das in (
+                (-1, Press.LEFT, Press.DAS_LEFT),
+                (1, Press.RIGHT, Press.DAS_RIGHT),
+            ):
+                shift = x
+                while board.can_place(shape, shift + step, y):
+                    shift += step
+                if shift != x:
+                    moves.append((press, (x + step, y, orientation)))
+                    moves.append((das, (shift, y, orientation)))
+            new_orientation, kicks = piece_type.cw_kicks[orientation]
+            for dx, dy in kicks:
+                if board.can_place(piece_type.shapes[new_orientation], x + dx, y + dy):
+                    moves.append((Press.ROTATE_CW, (x + dx, y + dy, new_orientation)))
+                    break
+            if landing != y:
+                moves.append((Press.SOFT_DROP, (x, landing, orientation)))
+
+            for press, child in moves:
+                if child not in parents:
+                    parents[child] = (state, press)
+                    queue.append(child)
+        return None
+
+    def hint(self, core, max_height=MAX_HEIGHT):
+        """
+        Returns (hold, presses) for the first piece of a perfect clear from
+        the core's current position, or None if none was found in time
+        """
+        piece = core.piece
+        if piece is None or not piece.blocks:
+            return None
+        pieces = [piece.type] + core.piece_generator.preview(
+            max_height * core.board.width // 4
+        )
+        solution = self.perfect_clear(
+            core.board,
+            pieces,
+            core.held_piece,
+            not core.held_swapped,
+            max_height,
+        )
+        if not solution:
+            return None
+        placement, hold = solution[0]
+        start = (
+            (*core.spawn, Orientation.NORTH)
+            if hold
+            else (piece.x, piece.y, piece.orientation)
+        )
+        return hold, self.finesse(core.board, placement.type, placement, *start)
+
+    def __start(self):
+        self.deadline = time.perf_counter() + self.time_limit_ms / 1000
+        self.timed_out = False
+        self.nodes = 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Search for a perfect clear from a board of garbage rows"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--rows",
+        nargs="*",
+        default=["###....###", "###....###"],
+        help="board rows from the top, # for filled",
+    )
+    parser.add_argument("--time-limit", type=float, default=1000, metavar="MS")
+    args = parser.parse_args()
+
+    board = Board()
+    board.lock(
+        [
+            (x, y)
+            for y, row in enumerate(reversed(args.rows), 1)
+            for x, cell in enumerate(row, 1)
+            if cell == "#"
+        ]
+    )
+    board.eliminate(board.full_rows())
+    pieces = PieceGenerator(args.seed).preview(11)
+    solver = Solver(args.time_limit)
+    start = time.perf_counter()
+    solution = solver.perfect_clear(board, pieces)
+    ms = (time.perf_counter() - start) * 1000
+    print(f"pieces {' '.join(piece_type.NAME for piece_type in pieces)}")
+    if solution is None:
+        result = "timed out" if solver.timed_out else "no perfect clear"
+        print(f"{result} after {solver.nodes} nodes in {ms:.1f}ms")
+    for placement, hold in solution or []:
+        y = Piece.spawn_position(board)[1]
+        route = solver.finesse(board, placement.type, placement, y=y if hold else None)
+        print(
+            f"{'hold, ' if hold else ''}{placement.type.NAME}"
+            f" at x {placement.x} y {placement.y} {placement.orientation.name}:"
+            f" {' '.join(press.name for press in route)}"
+        )
+        board.lock(placement.cells())
+        board.eliminate(board.full_rows())
+    if solution is not None:
+        print(f"found after {solver.nodes} nodes in {ms:.1f}ms")
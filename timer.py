@@ -1,51 +1,144 @@
-import pygame
+import heapq
+
+
+class Scheduler:
+    """
+    Deterministic timer scheduler driven by logical ticks (one tick is one
+    millisecond of game time).  Deadlines are kept in a priority queue and
+    fire in order of deadline, with ties broken by the order they were
+    scheduled, so the same inputs always produce the same sequence of timer
+    events regardless of frame rate.
+    """
+
+    def __init__(self):
+        self.now = 0
+        self.queue = []
+        self.sequence = 0
+
+    def schedule(self, timer, deadline):
+        heapq.heappush(self.queue, (deadline, self.sequence, timer, timer.generation))
+        self.sequence += 1
+
+    def advance(self, ticks):
+        """
+        Moves time forward by the given number of ticks and returns the timers
+        that elapsed, in the order they first elapsed.  A repeating timer that
+        elapsed more than once is only reported once.
+        """
+        target = self.now + ticks
+        fired = []
+        while self.queue and self.queue[0][0] <= target:
+            deadline, _, timer, generation = heapq.heappop(self.queue)
+            if generation != timer.generation:
+                # timer was stopped, paused or restarted since being scheduled
+                continue
+            self.now = deadline
+            timer.elapse()
+            if timer not in fired:
+                fired.append(timer)
+        self.now = target
+        return fired
+
+    def next_deadline(self):
+        """
+        Returns the tick of the next pending deadline or None if no timer is
+        running
+        """
+        while self.queue and self.queue[0][3] != self.queue[0][2].generation:
+            heapq.heappop(self.queue)
+        return self.queue[0][0] if self.queue else None
+
+    def clear(self):
+        for _, _, timer, _ in self.queue:
+            timer.generation += 1
+        self.queue = []
 
 
 class Timer:
-    def __init__(self, id):
-        self.id = id
-        self.last_start_time = None
-        self.duration_millis = None
-        self.initial_duration_millis = None
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        # bumped whenever the timer is rescheduled so stale queue entries
+        # are skipped
+        self.generation = 0
+        self.interval = None
         self.loops = None
+        self.deadline = None
+        self.remaining = None
+        # times the timer has elapsed, which can be several per advance
+        self.elapsed = 0
 
     def pause(self):
-        if self.duration_millis is not None:
-            self.duration_millis = self.duration_millis - (
-                pygame.time.get_ticks() - self.last_start_time
-            )
-            pygame.time.set_timer(self.id, 0)
+        if self.deadline is not None:
+            self.remaining = self.deadline - self.scheduler.now
+            self.__cancel()
 
     def resume(self):
-        if self.duration_millis is not None:
-            self.last_start_time = pygame.time.get_ticks()
-            pygame.time.set_timer(self.id, self.duration_millis)
-
-    def start(self, duration_millis, loops=0):
-        self.last_start_time = pygame.time.get_ticks()
-        self.duration_millis = duration_millis
-        self.initial_duration_millis = duration_millis
+        if self.remaining is not None:
+            self.__schedule(self.scheduler.now + self.remaining)
+            self.remaining = None
+
+    def start(self, duration, loops=0):
+        """
+        Starts the timer to elapse after duration ticks.  loops is the number
+        of times the timer elapses, with 0 repeating until stopped.  Durations
+        shorter than a tick are rounded up to one tick.
+        """
+        duration = max(duration, 1)
+        self.interval = duration
         self.loops = loops
-        pygame.time.set_timer(self.id, duration_millis, loops)
+        self.remaining = None
+        self.__schedule(self.scheduler.now + duration)
 
     def stop(self):
-        self.last_start_time = None
-        self.duration_millis = None
+        self.interval = None
         self.loops = None
-        pygame.time.set_timer(self.id, 0)
-
-    def notify(self):
-        """
-        Notify should be called whenever the timer event is emitted in order
-        to ensure the last start time is properly updated and that the
-        repeating duration is set if the timer was paused midway in an interval.
-        In general, this must be called on the event if the loops > 1
-        (or loops = 0 for repeating timers)
-        """
-        if (
-            self.duration_millis is not None
-            and self.duration_millis is not self.initial_duration_millis
-        ):
-            if self.loops != 0:
-                self.loops -= 1
-            self.start(self.initial_duration_millis, self.loops)
+        self.remaining = None
+        self.__cancel()
+
+    def progress(self, ahead=0):
+        """
+        Returns the fraction of the current interval that will have elapsed
+        ahead ticks from now, between 0 and 1, or 0 if the timer is not
+        running
+        """
+        if self.deadline is None:
+            return 0
+        elapsed = self.interval - (self.deadline - self.scheduler.now) + ahead
+        return min(max(elapsed / self.interval, 0), 1)
+
+    def snapshot(self):
+        """
+        Returns the timer state with the deadline relative to the current tick
+        """
+        delay = None if self.deadline is None else self.deadline - self.scheduler.now
+        return (self.interval, self.loops, delay, self.remaining)
+
+    def restore(self, snapshot):
+        self.interval, self.loops, delay, self.remaining = snapshot
+        if delay is None:
+            self.__cancel()
+        else:
+            self.__schedule(self.scheduler.now + delay)
+
+    def elapse(self):
+        """
+        Called by the scheduler when the deadline is reached.  Repeating
+        timers always continue with the full interval, even if they were
+        paused midway through the previous one.
+        """
+        self.elapsed += 1
+        if self.loops == 1:
+            self.stop()
+            return
+        if self.loops > 1:
+            self.loops -= 1
+        self.__schedule(self.deadline + self.interval)
+
+    def __schedule(self, deadline):
+        self.generation += 1
+        self.deadline = deadline
+        self.scheduler.schedule(self, deadline)
+
+    def __cancel(self):
+        self.generation += 1
+        self.deadline = None
@@ -0,0 +1,222 @@
+from bot import Bot
+from game_core import GameCore, State
+
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+import argparse
+import csv
+import json
+import os
+import statistics
+import time
+
+
+class Tournament:
+    """
+    Plays headless bot games across a process pool.  Every game has its own
+    seed and bot configuration, and its result is appended to the output
+    file as soon as it finishes, as JSON lines or, if the file name ends in
+    .csv, as CSV rows.  Games already in the output file are skipped when
+    resuming, so an interrupted run can be continued.
+    """
+
+    FIELDS = [
+        "game",
+        "seed",
+        "beam_width",
+        "time_budget_ms",
+        "lines",
+        "score",
+        "pieces",
+        "level",
+        "topped_out",
+        "seconds",
+        "ms_per_piece",
+    ]
+    FLOAT_FIELDS = {"time_budget_ms", "seconds", "ms_per_piece"}
+    STATISTICS = ["lines", "score", "pieces", "level", "ms_per_piece"]
+
+    def __init__(self, games, output, workers=None):
+        """
+        games is a list of (game id, seed, beam width, time budget, max
+        pieces) tuples, the arguments of play()
+        """
+        self.games = games
+        self.output = output
+        self.workers = workers
+        self.csv = output.endswith(".csv")
+
+    def run(self, resume=False):
+        """
+        Plays every game that has no result yet and returns all results
+        """
+        results = self.load() if resume else []
+        done = {result["game"] for result in results}
+        pending = [game for game in self.games if game[0] not in done]
+
+        # the file is rewritten from the loaded results so that a partial
+        # line left by a crash is dropped rather than appended to
+        with open(self.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, Tournament.FIELDS) if self.csv else None
+            if writer:
+                writer.writeheader()
+            for result in results:
+                self.__write(f, writer, result)
+            f.flush()
+            with ProcessPoolExecutor(self.workers) as pool:
+                futures = [pool.submit(Tournament.play, *game) for game in pending]
+                for future in as_completed(futures):
+                    result = future.result()
+                    self.__write(f, writer, result)
+                    f.flush()
+                    results.append(result)
+                    print(
+                        f"game {result['game']}: lines {result['lines']}"
+                        f" score {result['score']} pieces {result['pieces']}"
+                        f" ({len(results)}/{len(self.games)})",
+                        flush=True,
+                    )
+        return results
+
+    @staticmethod
+    def __write(f, writer, result):
+        if writer:
+            writer.writerow(result)
+        else:
+            f.write(json.dumps(result) + "\n")
+
+    def load(self):
+        """
+        Returns the results already written to the output file.  A partial
+        last line left by a crash is ignored, as is any row that does not
+        parse.
+        """
+        if not os.path.exists(self.output):
+            return []
+        with open(self.output, newline="") as f:
+            lines = f.readlines()
+        # a last line without a newline was cut off while being written
+        if lines and not lines[-1].endswith("\n"):
+            lines.pop()
+        results = []
+        if self.csv:
+            for row in csv.DictReader(lines):
+                if None in row.values():
+                    continue
+                try:
+                    results.append(Tournament.__parse(row))
+                except ValueError:
+                    continue
+            return results
+        for line in lines:
+            try:
+                results.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+        return results
+
+    @staticmethod
+    def __parse(row):
+        """
+        Returns the result held in a CSV row, raising ValueError if a field
+        does not parse
+        """
+        result = {}
+        for field in Tournament.FIELDS:
+            if field == "topped_out":
+                if row[field] not in ("True", "False"):
+                    raise ValueError(f"Invalid topped_out {row[field]!r}")
+                result[field] = row[field] == "True"
+            elif field in Tournament.FLOAT_FIELDS:
+                result[field] = float(row[field])
+            else:
+                result[field] = int(row[field])
+        return result
+
+    @staticmethod
+    def play(game, seed, beam_width, time_budget_ms, max_pieces=1000):
+        """
+        Plays one game until the bot tops out or has placed max_pieces
+        pieces, and returns its result
+        """
+        core = GameCore(seed)
+        bot = Bot(beam_width, time_budget_ms, restart=False)
+        start = time.perf_counter()
+        while core.state != State.GAME_OVER and bot.pieces < max_pieces:
+            core.step(bot.inputs(core), Bot.FRAME_MS)
+        seconds = time.perf_counter() - start
+        return {
+            "game": game,
+            "seed": seed,
+            "beam_width": beam_width,
+            "time_budget_ms": time_budget_ms,
+            "lines": core.lines,
+            "score": core.score,
+            "pieces": bot.pieces,
+            "level": core.level,
+            "topped_out": core.state == State.GAME_OVER,
+            "seconds": seconds,
+            "ms_per_piece": seconds * 1000 / max(bot.pieces, 1),
+        }
+
+    @staticmethod
+    def summarize(results):
+        """
+        Returns the mean, median, min and max of each statistic, overall and
+        for every bot configuration, or an empty summary without results
+        """
+        groups = {"all": results} if results else {}
+        for result in results:
+            key = f"beam {result['beam_width']} budget {result['time_budget_ms']}ms"
+            groups.setdefault(key, []).append(result)
+
+        summary = {}
+        for key, group in groups.items():
+            summary[key] = {"games": len(group)}
+            summary[key]["top_outs"] = sum(result["topped_out"] for result in group)
+            for name in Tournament.STATISTICS:
+                values = [result[name] for result in group]
+                summary[key][name] = {
+                    "mean": statistics.mean(values),
+                    "median": statistics.median(values),
+                    "min": min(values),
+                    "max": max(values),
+                }
+        return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Play headless bot games in parallel and collect the results"
+    )
+    parser.add_argument("--games", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    parser.add_argument(
+        "--beam-width",
+        type=int,
+        nargs="+",
+        default=[8],
+        help="bot configurations are every beam width and time budget pair",
+    )
+    parser.add_argument(
+        "--time-budget", type=float, nargs="+", default=[50.0], metavar="MS"
+    )
+    parser.add_argument("--max-pieces", type=int, default=1000)
+    parser.add_argument("--workers", type=int, help="defaults to the number of CPUs")
+    parser.add_argument(
+        "--output", default="tournament.jsonl", help="results file, .jsonl or .csv"
+    )
+    parser.add_argument(
+        "--resume", action="store_true", help="skip games already in the output"
+    )
+    args = parser.parse_args()
+
+    configurations = list(product(args.beam_width, args.time_budget))
+    games = [
+        (i, args.seed + i, *configurations[i % len(configurations)], args.max_pieces)
+        for i in range(args.games)
+    ]
+    tournament = Tournament(games, args.output, args.workers)
+    results = tournament.run(args.resume)
+    print(json.dumps(Tournament.summarize(results), indent=2))
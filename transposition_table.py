@@ -0,0 +1,51 @@
+from collections import OrderedDict
+
+
+class TranspositionTable:
+    """
+    Bounded cache of search results keyed by Zobrist hash.  Each entry
+    records the depth it was searched to; a lookup only hits if the stored
+    result was searched at least as deep as requested, and a store never
+    replaces a deeper result with a shallower one.  When full, the least
+    recently used entry is evicted.
+    """
+
+    def __init__(self, max_size=65536):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, depth=0):
+        """
+        Returns the result stored for key if it was searched to at least
+        depth, otherwise None
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < depth:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, value, depth=0):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            if entry[0] > depth:
+                return
+        self.entries[key] = (depth, value)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,45 @@
+class Varint:
+    """
+    Unsigned LEB128 varints, with zigzag encoding for signed values and a
+    +1 offset for optional values where 0 means None
+    """
+
+    @staticmethod
+    def write(buffer, value):
+        while value >= 0x80:
+            buffer.append(value & 0x7F | 0x80)
+            value >>= 7
+        buffer.append(value)
+
+    @staticmethod
+    def read(data, pos):
+        """
+        Returns the varint at pos and the position after it
+        """
+        value = 0
+        shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return value, pos
+            shift += 7
+
+    @staticmethod
+    def write_signed(buffer, value):
+        Varint.write(buffer, value << 1 if value >= 0 else (-value << 1) - 1)
+
+    @staticmethod
+    def read_signed(data, pos):
+        value, pos = Varint.read(data, pos)
+        return (value >> 1 if not value & 1 else -((value + 1) >> 1)), pos
+
+    @staticmethod
+    def write_optional(buffer, value):
+        Varint.write(buffer, 0 if value is None else value + 1)
+
+    @staticmethod
+    def read_optional(data, pos):
+        value, pos = Varint.read(data, pos)
+        return (None if value == 0 else value - 1), pos
@@ -0,0 +1,58 @@
+import random
+
+
+class Zobrist:
+    """
+    64-bit Zobrist keys for board cells and piece state.  A position's hash
+    is the xor of the keys of its features, so adding or removing a feature
+    is a single xor.  Keys are derived from the feature itself rather than
+    from generation order, so hashes are the same in every process.
+    """
+
+    KEYS = {}
+
+    @staticmethod
+    def key(*feature):
+        key = Zobrist.KEYS.get(feature)
+        if key is None:
+            key = random.Random(repr(feature)).getrandbits(64)
+            Zobrist.KEYS[feature] = key
+        return key
+
+    @staticmethod
+    def cell(x, y):
+        return Zobrist.key("cell", x, y)
+
+    @staticmethod
+    def size(board):
+        """
+        Returns the key of the board dimensions, so that boards of different
+        sizes with the same cells hash differently
+        """
+        return Zobrist.key("width", board.width) ^ Zobrist.key("height", board.height)
+
+    @staticmethod
+    def row(y, mask):
+        """
+        Returns the xor of the keys of the filled cells in a row bitmask
+        """
+        key = 0
+        while mask:
+            bit = mask & -mask
+            key ^= Zobrist.cell(bit.bit_length(), y)
+            mask ^= bit
+        return key
+
+    @staticmethod
+    def piece(piece_type, x, y, orientation):
+        """
+        Returns the key of an active piece.  Type, x, y and orientation each
+        contribute a key of their own, so a move or rotation can update the
+        hash by xoring out the old value and xoring in the new one.
+        """
+        return (
+            Zobrist.key("type", piece_type.NAME)
+            ^ Zobrist.key("x", x)
+            ^ Zobrist.key("y", y)
+            ^ Zobrist.key("orientation", orientation.value)
+        )